@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+import shutil
+import uuid
+from collections import OrderedDict
+
+log = logging.getLogger('ticketbot.answers')
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class AttachmentInfo:
+    # Поля discord.Attachment, нужные для скачивания и текста ответа
+    __slots__ = ("filename", "url", "size", "content_type")
+
+    def __init__(self, filename, url, size, content_type=None):
+        self.filename = filename
+        self.url = url
+        self.size = size
+        self.content_type = content_type
+
+    @classmethod
+    def from_attachment(cls, attachment):
+        return cls(attachment.filename, attachment.url, attachment.size, attachment.content_type)
+
+
+class PendingMessage:
+    # Сообщение заявителя до нажатия «Отправить»: сам discord.Message не
+    # хранится, чтобы не держать автора, канал и кэш гильдии.
+    __slots__ = ("id", "content", "attachments")
+
+    def __init__(self, id, content, attachments):
+        self.id = id
+        self.content = content
+        self.attachments = attachments
+
+    @classmethod
+    def from_message(cls, message):
+        return cls(message.id, message.content, [AttachmentInfo.from_attachment(attachment) for attachment in message.attachments])
+
+
+class StoredFile:
+    # Содержимое файла лежит в AttachmentCache под ключом `key`; после
+    # отправки в сводку остаётся только ссылка на сообщение. `message_id` —
+    # сообщение заявителя с вложением: оно не удаляется, пока файл не
+    # загружен в сводку, иначе `url` перестанет открываться.
+    __slots__ = ("filename", "url", "size", "message_url", "key", "message_id")
+
+    def __init__(self, filename, url, size, message_url=None, key=None, message_id=None):
+        self.filename = filename
+        self.url = url
+        self.size = size
+        self.message_url = message_url
+        self.key = key
+        self.message_id = message_id
+
+    def to_state(self):
+        return {
+            "filename": self.filename,
+            "url": self.url,
+            "size": self.size,
+            "message_url": self.message_url,
+            "key": self.key,
+            "message_id": self.message_id,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state["filename"], state.get("url"), state.get("size", 0), state.get("message_url"), state.get("key"), state.get("message_id"))
+
+
+class Answer:
+    __slots__ = ("text", "files", "message_ids")
+
+    def __init__(self, text, files=None, message_ids=None):
+        self.text = text
+        self.files = files if files is not None else []
+        self.message_ids = message_ids if message_ids is not None else []
+
+    def to_state(self):
+        return {"text": self.text, "files": [file.to_state() for file in self.files], "message_ids": self.message_ids}
+
+    @classmethod
+    def from_state(cls, state):
+        # Содержимое файлов остаётся в AttachmentCache и переживает перезапуск
+        return cls(state["text"], [StoredFile.from_state(file) for file in state["files"]], state.get("message_ids", []))
+
+
+class AttachmentCache:
+    # Ограниченный по объёму кэш вложений на диске. При переполнении
+    # удаляются давно не использованные файлы: такие вложения попадут в
+    # сводку ссылкой на Discord, а не загрузкой.
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def path(self, key):
+        return os.path.join(self.directory, str(key))
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+        self._entries.clear()
+        self.used = 0
+
+    def restore(self, keys):
+        # Файлы открытых заявок (их ключи сохранены в состоянии) остаются
+        # после перезапуска, остальные удаляются. Порядок вытеснения
+        # восстанавливается по времени изменения.
+        os.makedirs(self.directory, exist_ok=True)
+        self._entries.clear()
+        self.used = 0
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name in keys:
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+            else:
+                self._remove(entry.name)
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self.used += size
+        while self.used > self.max_bytes:
+            key, size = self._entries.popitem(last=False)
+            self.used -= size
+            self._remove(key)
+
+    def _write(self, key, data):
+        data.seek(0)
+        with open(self.path(key), "wb") as f:
+            shutil.copyfileobj(data, f, COPY_CHUNK_SIZE)
+
+    def _remove(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    async def put(self, data, size):
+        if size > self.max_bytes:
+            return None
+        key = uuid.uuid4().hex
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self._write, key, data)
+        except OSError:
+            log.exception("Error writing attachment to cache")
+            await loop.run_in_executor(None, self._remove, key)
+            return None
+        self._entries[key] = size
+        self.used += size
+        evicted = []
+        while self.used > self.max_bytes:
+            old_key, old_size = self._entries.popitem(last=False)
+            self.used -= old_size
+            evicted.append(old_key)
+        for old_key in evicted:
+            self._remove(old_key)
+        return key if key in self._entries else None
+
+    def open(self, key):
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        try:
+            return open(self.path(key), "rb")
+        except FileNotFoundError:
+            self.discard(key)
+            return None
+
+    def discard(self, key):
+        size = self._entries.pop(key, None)
+        if size is None:
+            return
+        self.used -= size
+        self._remove(key)
@@ -0,0 +1,75 @@
+import asyncio
+import gzip
+from datetime import datetime, timedelta
+
+MAX_RESULTS = 10
+
+
+def answers_text(questions, responses):
+    return "\n\n".join(
+        f"{i}. {question}\n{response.text}"
+        for i, (question, response) in enumerate(zip(questions, responses), 1)
+    )
+
+
+def parse_date(value):
+    return datetime.strptime(value.strip(), "%Y-%m-%d")
+
+
+class ApplicationArchive:
+    # Закрытые заявки хранятся в MySQL вместе со сжатым транскриптом, чтобы
+    # искать по ним индексами, не перебирая историю архивного канала.
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def store(self, application_number, channel, user_id, username, nickname, closed_by, answers, transcript, archive_url=None):
+        compressed = await asyncio.get_running_loop().run_in_executor(None, gzip.compress, transcript)
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "INSERT INTO application_archive (application_number, channel_id, channel_name, user_id, username, nickname, "
+                    "closed_by, closed_at, archive_url, answers, transcript) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                    (application_number, channel.id, channel.name, user_id, username, nickname,
+                     closed_by, datetime.now(), archive_url, answers, compressed)
+                )
+
+    async def search(self, nickname=None, user_id=None, date_from=None, date_to=None, text=None, limit=MAX_RESULTS):
+        conditions = []
+        args = []
+        if nickname:
+            conditions.append("nickname LIKE %s")
+            args.append(nickname.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if user_id:
+            conditions.append("user_id = %s")
+            args.append(user_id)
+        if date_from:
+            conditions.append("closed_at >= %s")
+            args.append(date_from)
+        if date_to:
+            conditions.append("closed_at < %s")
+            args.append(date_to + timedelta(days=1))
+        if text:
+            conditions.append("MATCH(answers) AGAINST(%s IN NATURAL LANGUAGE MODE)")
+            args.append(text)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "SELECT application_number, channel_name, user_id, username, nickname, closed_by, closed_at, archive_url "
+                    f"FROM application_archive {where} ORDER BY closed_at DESC LIMIT %s",
+                    args + [limit]
+                )
+                return await cur.fetchall()
+
+    async def transcript(self, application_number):
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "SELECT channel_name, transcript FROM application_archive WHERE application_number=%s ORDER BY closed_at DESC LIMIT 1",
+                    (application_number,)
+                )
+                result = await cur.fetchone()
+        if not result:
+            return None
+        channel_name, compressed = result
+        return channel_name, await asyncio.get_running_loop().run_in_executor(None, gzip.decompress, compressed)
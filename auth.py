@@ -0,0 +1,32 @@
+DENIED_MESSAGE = "У вас нет прав для выполнения этого действия!"
+
+
+class AdminRoleCache:
+    def __init__(self, role_names):
+        self.role_names = frozenset(role_names)
+        self._role_ids = {}
+
+    def role_ids(self, guild):
+        role_ids = self._role_ids.get(guild.id)
+        if role_ids is None:
+            role_ids = frozenset(role.id for role in guild.roles if role.name in self.role_names)
+            self._role_ids[guild.id] = role_ids
+        return role_ids
+
+    def roles(self, guild):
+        return [role for role in map(guild.get_role, self.role_ids(guild)) if role]
+
+    def invalidate(self, guild):
+        self._role_ids.pop(guild.id, None)
+
+    def is_admin(self, member):
+        guild = getattr(member, 'guild', None)
+        if guild is None:
+            return False
+        return not self.role_ids(guild).isdisjoint(role.id for role in member.roles)
+
+    async def check(self, interaction):
+        if self.is_admin(interaction.user):
+            return True
+        await interaction.response.send_message(DENIED_MESSAGE, ephemeral=True)
+        return False
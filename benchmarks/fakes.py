@@ -0,0 +1,437 @@
+import asyncio
+import io
+import itertools
+import os
+import re
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import aiomysql
+import discord
+
+# Snowflake'и от текущего времени: бот проверяет возраст сообщений по id
+_ids = itertools.count(discord.utils.time_snowflake(datetime.now(timezone.utc)))
+
+
+def next_id():
+    return next(_ids)
+
+
+def load_main():
+    # main.py читает конфигурацию при импорте
+    os.environ.setdefault('DISCORD_TOKEN', 'benchmark')
+    os.environ.setdefault('CATEGORY_ID', '1')
+    os.environ.setdefault('ADMIN_ROLES', '["Администратор", "Модератор"]')
+    os.environ.setdefault('ARCHIVE_CHANNEL_ID', '2')
+    os.environ.setdefault('ACCEPT_ROLE', 'player')
+    os.environ.setdefault('REJECT_ROLE', 'rejected')
+    os.environ.setdefault('METRICS_PORT', '0')
+    import main
+    return main
+
+
+class FakeCursor:
+    def __init__(self, pool):
+        self.pool = pool
+        self._rows = []
+        self.lastrowid = None
+        self.rowcount = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query, args=None):
+        self.pool.queries += 1
+        if self.pool.latency:
+            await asyncio.sleep(self.pool.latency)
+        result = self.pool.responder(query, args)
+        if isinstance(result, dict):
+            self._rows = result.get("rows", [])
+            self.lastrowid = result.get("lastrowid")
+            self.rowcount = result.get("rowcount", len(self._rows))
+        else:
+            self._rows = list(result or [])
+            self.rowcount = len(self._rows)
+        return self.rowcount
+
+    async def executemany(self, query, args):
+        self.pool.queries += 1
+        if self.pool.latency:
+            await asyncio.sleep(self.pool.latency)
+        self.pool.responder(query, list(args))
+        self.rowcount = len(args)
+        return self.rowcount
+
+    async def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    async def fetchall(self):
+        return list(self._rows)
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self):
+        return FakeCursor(self.pool)
+
+    async def begin(self):
+        pass
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+
+class FakePool:
+    def __init__(self, responder=None, latency=0.0, size=10):
+        self.responder = responder or (lambda query, args: [])
+        self.latency = latency
+        self.queries = 0
+        self._semaphore = asyncio.Semaphore(size)
+
+    @asynccontextmanager
+    async def acquire(self):
+        async with self._semaphore:
+            yield FakeConnection(self)
+
+
+class FakeAsset:
+    def __init__(self, url):
+        self.url = url
+
+
+class FakeRole:
+    def __init__(self, name, guild=None):
+        self.id = next_id()
+        self.name = name
+        self.guild = guild
+
+
+class FakeUser:
+    def __init__(self, name, guild=None, roles=(), bot=False):
+        self.id = next_id()
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{self.id}>"
+        self.avatar = None
+        self.default_avatar = FakeAsset("https://cdn.discordapp.com/embed/avatars/0.png")
+        self.bot = bot
+        self.guild = guild
+        self.roles = list(roles)
+        self.dms = []
+
+    def __str__(self):
+        return self.name
+
+    async def send(self, content=None, **kwargs):
+        self.dms.append((content, kwargs))
+
+
+class FakeAttachment:
+    def __init__(self, filename, size, content_type="image/png"):
+        self.id = next_id()
+        self.filename = filename
+        self.size = size
+        self.content_type = content_type
+        self.url = f"https://cdn.discordapp.com/attachments/{self.id}/{filename}"
+
+
+class FakeMessage:
+    def __init__(self, channel, author, content="", embeds=(), attachments=()):
+        self.id = next_id()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content or ""
+        self.embeds = list(embeds)
+        self.attachments = list(attachments)
+        self.created_at = datetime.now(timezone.utc)
+        self.jump_url = f"https://discord.com/channels/{channel.guild.id}/{channel.id}/{self.id}"
+
+
+class FakeChannel:
+    def __init__(self, guild, name, latency=0.0):
+        self.id = next_id()
+        self.name = name
+        self.guild = guild
+        self.mention = f"<#{self.id}>"
+        self.latency = latency
+        self.messages = {}
+        self.sent = 0
+        self.uploaded_files = 0
+        self.last_view_message = None
+        self.deleted = False
+
+    async def _rest(self):
+        self.guild.rest_calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def send(self, content=None, *, embed=None, embeds=None, file=None, files=None, view=None, **kwargs):
+        await self._rest()
+        embeds = list(embeds or []) + ([embed] if embed else [])
+        files = list(files or []) + ([file] if file else [])
+        attachments = []
+        for f in files:
+            attachments.append(FakeAttachment(f.filename, 0))
+        self.sent += 1
+        self.uploaded_files += len(files)
+        message = FakeMessage(self, self.guild.me, content, embeds, attachments)
+        self.messages[message.id] = message
+        if view is not None:
+            self.last_view_message = message
+        if self.guild.on_message:
+            # Discord доставляет собственные сообщения бота через gateway
+            await self.guild.on_message(message)
+        return message
+
+    def add_user_message(self, author, content="", attachments=()):
+        message = FakeMessage(self, author, content, attachments=attachments)
+        self.messages[message.id] = message
+        return message
+
+    async def delete_messages(self, messages):
+        await self._rest()
+        for message in messages:
+            self.messages.pop(message.id, None)
+
+    def get_partial_message(self, message_id):
+        return FakePartialMessage(self, message_id)
+
+    async def history(self, limit=None, oldest_first=False):
+        messages = sorted(self.messages.values(), key=lambda m: m.id, reverse=not oldest_first)
+        for i, message in enumerate(messages):
+            if i % 100 == 0:
+                await self._rest()
+            yield message
+
+    async def delete(self):
+        await self._rest()
+        self.deleted = True
+        self.guild.channels.pop(self.id, None)
+
+
+class FakePartialMessage:
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.id = message_id
+
+    async def delete(self):
+        await self.channel._rest()
+        self.channel.messages.pop(self.id, None)
+
+
+class FakeCategory:
+    def __init__(self, guild, latency=0.0):
+        self.id = next_id()
+        self.guild = guild
+        self.latency = latency
+        self.text_channels = []
+
+    async def create_text_channel(self, name, overwrites=None):
+        channel = FakeChannel(self.guild, name, latency=self.latency)
+        self.guild.rest_calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.text_channels.append(channel)
+        self.guild.channels[channel.id] = channel
+        return channel
+
+
+class FakeGuild:
+    def __init__(self, admin_role_names=("Администратор", "Модератор")):
+        self.id = next_id()
+        self.filesize_limit = 25 * 1024 * 1024
+        self.rest_calls = 0
+        self.on_message = None
+        self.channels = {}
+        self.members = {}
+        self.default_role = FakeRole("@everyone", self)
+        self.roles = [self.default_role] + [FakeRole(name, self) for name in admin_role_names]
+        self.me = FakeUser("TicketBot", self, bot=True)
+
+    def get_role(self, role_id):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    def add_member(self, name, admin=False):
+        roles = [self.default_role] + ([self.roles[1]] if admin else [])
+        member = FakeUser(name, self, roles)
+        self.members[member.id] = member
+        return member
+
+
+class FakeWhitelistDatabase:
+    # Минимальная замена таблиц whitelist/application_counter: понимает
+    # запросы, которые выполняет бот, остальные принимает без результата.
+    UPDATE_RE = re.compile(r"UPDATE whitelist SET (.+?) WHERE `?(\w+)`?\s*(=\s*%s|IN \(.*\))", re.DOTALL)
+    SELECT_RE = re.compile(r"SELECT (.+?) FROM whitelist WHERE `?(\w+)`?\s*=\s*%s", re.DOTALL)
+    COLUMN_RE = re.compile(r"`?(\w+)`?\s*=\s*%s")
+    DELETE_RE = re.compile(r"DELETE FROM whitelist WHERE (.+)", re.DOTALL)
+    BULK_SELECT_RE = re.compile(r"SELECT id, application_number, channel_id, .*? WHERE channel_id IN \(([^)]*)\)(.*)", re.DOTALL)
+
+    def __init__(self):
+        self.counter = 0
+        self.rows = {}
+        self.by_username = {}
+        self._ids = itertools.count(1)
+
+    def __call__(self, query, args):
+        if query.startswith("INSERT INTO application_counter"):
+            self.counter += 1
+            return {"lastrowid": self.counter, "rowcount": 1}
+        if query.startswith("INSERT INTO whitelist "):
+            return self._insert(args)
+        if query.startswith("SELECT w.id, w.username, w.nickname"):
+            return self._pending(args)
+        match = self.BULK_SELECT_RE.match(query)
+        if match:
+            return self._bulk_select(match, args)
+        match = self.UPDATE_RE.match(query)
+        if match:
+            return self._update(match, args)
+        match = self.DELETE_RE.match(query)
+        if match:
+            return self._delete(match, args)
+        match = self.SELECT_RE.match(query)
+        if match:
+            columns = [column.strip() for column in match.group(1).split(",")]
+            return [tuple(row.get(column) for column in columns) for row in self._where(match.group(2), [args[0]])]
+        return []
+
+    def _insert(self, args):
+        username, user_id, action, created, channel_id, number = args
+        if username in self.by_username:
+            raise aiomysql.IntegrityError(1062, f"Duplicate entry '{username}' for key 'username'")
+        row = {
+            "id": next(self._ids), "username": username, "user_id": user_id, "action": action,
+            "create_datetime": created, "role_datetime": None, "nickname": None,
+            "channel_id": channel_id, "join": 0, "application_number": number,
+        }
+        self.rows[row["id"]] = row
+        self.by_username[username] = row
+        return {"lastrowid": row["id"], "rowcount": 1}
+
+    def _where(self, column, values):
+        values = set(values)
+        return [row for row in self.rows.values() if row.get(column) in values]
+
+    def _update(self, match, args):
+        columns = self.COLUMN_RE.findall(match.group(1))
+        values, keys = args[:len(columns)], args[len(columns):]
+        rows = self._where(match.group(2), keys)
+        for row in rows:
+            row.update(zip(columns, values))
+        return {"rowcount": len(rows)}
+
+    def _delete(self, match, args):
+        conditions = list(zip(self.COLUMN_RE.findall(match.group(1)), args))
+        rows = [row for row in self.rows.values() if all(row.get(column) == value for column, value in conditions)]
+        for row in rows:
+            del self.rows[row["id"]]
+            self.by_username.pop(row["username"], None)
+        return {"rowcount": len(rows)}
+
+    def _bulk_select(self, match, args):
+        count = match.group(1).count("%s")
+        rows = self._where("channel_id", args[:count])
+        extra = list(args[count:])
+        conditions = match.group(2)
+        if "application_number IN" in conditions:
+            count = conditions.count("%s") - ("create_datetime <=" in conditions) - ("action =" in conditions)
+            numbers, extra = set(extra[:count]), extra[count:]
+            rows = [row for row in rows if row["application_number"] in numbers]
+        if "create_datetime <=" in conditions:
+            before = extra.pop(0)
+            rows = [row for row in rows if row["create_datetime"] <= before]
+        if "action =" in conditions:
+            action = extra.pop(0)
+            rows = [row for row in rows if row["action"] == action]
+        columns = ("id", "application_number", "channel_id", "username", "user_id", "nickname", "action", "create_datetime")
+        return [tuple(row[column] for column in columns) for row in rows]
+
+    def _pending(self, args):
+        action, join, *channel_ids = args
+        rows = [row for row in self.rows.values() if row["action"] == action and row["join"] == join]
+        if channel_ids:
+            rows = [row for row in rows if row["channel_id"] in set(channel_ids)]
+        return [(row["id"], row["username"], row["nickname"], 0) for row in rows]
+
+
+def luckperms_responder(query, args):
+    if query.startswith("SELECT username, uuid FROM luckperms_players"):
+        return [(name, f"uuid-{name}") for name in args]
+    return []
+
+
+class FakeDownloader:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    async def download_all(self, attachments, budget):
+        if self.latency and attachments:
+            await asyncio.sleep(self.latency)
+        files = []
+        for attachment in attachments:
+            if not budget.reserve(attachment.size):
+                files.append(None)
+                continue
+            files.append({"filename": attachment.filename, "url": attachment.url, "data": io.BytesIO(b"\0" * attachment.size), "size": attachment.size})
+        return files
+
+
+class FakeInteractionResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self._done = False
+        self.messages = []
+        self.modal = None
+        self.view = None
+
+    def is_done(self):
+        return self._done
+
+    async def send_message(self, content=None, *, view=None, **kwargs):
+        self._done = True
+        self.messages.append(content)
+        self.view = view
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+    async def send_modal(self, modal):
+        self._done = True
+        self.modal = modal
+
+
+class FakeFollowup:
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, content=None, **kwargs):
+        self.messages.append(content)
+
+
+class FakeInteraction:
+    def __init__(self, user, channel, custom_id=None, message=None):
+        self.type = discord.InteractionType.component
+        self.user = user
+        self.channel = channel
+        self.message = message
+        self.guild = channel.guild
+        self.data = {"custom_id": custom_id} if custom_id else {}
+        self.response = FakeInteractionResponse(self)
+        self.followup = FakeFollowup()
+        self.edits = []
+
+    async def edit_original_response(self, content=None, **kwargs):
+        self.edits.append(content)
@@ -0,0 +1,236 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fakes import (
+    FakeAttachment, FakeCategory, FakeChannel, FakeDownloader, FakeGuild, FakeInteraction,
+    FakePool, FakeWhitelistDatabase, load_main, luckperms_responder
+)
+
+
+class StepRecorder:
+    def __init__(self):
+        self.timings = {}
+        self.errors = {}
+
+    async def run(self, step, coro):
+        start = time.perf_counter()
+        try:
+            return await coro
+        except Exception as e:
+            self.errors[step] = self.errors.get(step, 0) + 1
+            print(f"{step} failed: {e!r}", file=sys.stderr)
+        finally:
+            self.timings.setdefault(step, []).append(time.perf_counter() - start)
+
+    def report(self):
+        steps = {}
+        for step, timings in sorted(self.timings.items()):
+            timings.sort()
+            steps[step] = {
+                "count": len(timings),
+                "errors": self.errors.get(step, 0),
+                "p50": percentile(timings, 0.50),
+                "p95": percentile(timings, 0.95),
+                "p99": percentile(timings, 0.99),
+                "max": timings[-1],
+            }
+        return steps
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class Simulation:
+    def __init__(self, main, args):
+        self.main = main
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.recorder = StepRecorder()
+        self.guild = FakeGuild()
+        self.category = FakeCategory(self.guild, latency=args.rest_latency)
+        self.panel = FakeChannel(self.guild, "заявки", latency=args.rest_latency)
+        self.archive = FakeChannel(self.guild, "архив", latency=args.rest_latency)
+        self.moderator = self.guild.add_member("moderator", admin=True)
+        self.abandoned = 0
+        self.database = FakeWhitelistDatabase()
+        self.work_dir = tempfile.TemporaryDirectory(prefix="ticketbot-loadsim-")
+
+    def install(self):
+        from answers import AttachmentCache
+        from archive import ApplicationArchive
+        from lp_sync import LuckPermsSync, LuckPermsSyncQueue
+        from state_store import ApplicationStateStore
+        from ticket_log import TicketLog
+
+        main = self.main
+        channels = {main.CATEGORY_ID: self.category, main.ARCHIVE_CHANNEL_ID: self.archive}
+        main.bot.get_channel = lambda channel_id: channels.get(channel_id) or self.guild.channels.get(channel_id)
+        self.guild.on_message = main.on_message
+        main.mysql_pool = FakePool(self.database, latency=self.args.db_latency)
+        main.mysql_lp_pool = FakePool(luckperms_responder, latency=self.args.db_latency)
+        main.state_store = ApplicationStateStore(main.mysql_pool, flush_interval=1)
+        main.application_archive = ApplicationArchive(main.mysql_pool)
+        main.sync_queue = LuckPermsSyncQueue(LuckPermsSync(main.mysql_pool, main.mysql_lp_pool), main.SYNC_TARGETS)
+        main.downloader = FakeDownloader(latency=self.args.download_latency)
+        main.ticket_log = TicketLog(os.path.join(self.work_dir.name, "transcripts"), flush_interval=1)
+        main.attachment_cache = AttachmentCache(os.path.join(self.work_dir.name, "attachments"), main.ATTACHMENT_CACHE_SIZE)
+        main.attachment_cache.clear()
+        return [
+            asyncio.ensure_future(main.state_store.run()),
+            asyncio.ensure_future(main.ticket_log.run()),
+            asyncio.ensure_future(main.sync_queue.run_worker()),
+        ]
+
+    async def click(self, step, user, channel, custom_id):
+        message = channel.last_view_message
+        interaction = FakeInteraction(user, channel, custom_id, message)
+        if message is not None and self.rng.random() < self.args.double_click_rate:
+            # Второе нажатие приходит, пока первое ещё обрабатывается
+            duplicate = FakeInteraction(user, channel, custom_id, message)
+            await asyncio.gather(
+                self.recorder.run(step, self.main.on_interaction(interaction)),
+                self.recorder.run(step, self.main.on_interaction(duplicate))
+            )
+            return interaction
+        await self.recorder.run(step, self.main.on_interaction(interaction))
+        return interaction
+
+    async def answer(self, applicant, channel, index, question_number):
+        for part in range(self.rng.randint(1, 2)):
+            if question_number == 2 and part == 0:
+                content = f"`Player{index}`"
+            else:
+                content = "ответ " * self.rng.randint(5, 200)
+            attachments = []
+            if self.rng.random() < self.args.attachment_rate:
+                attachments.append(FakeAttachment(f"screenshot{question_number}.png", self.rng.randint(10_000, 500_000)))
+            message = channel.add_user_message(applicant, content, attachments)
+            await self.recorder.run("on_message", self.main.on_message(message))
+        await self.click("send_response", applicant, channel, "send_response")
+
+    async def submit_modal(self, step, modal, channel, **values):
+        for name, value in values.items():
+            getattr(modal, name)._value = value
+        interaction = FakeInteraction(self.moderator, channel)
+        await self.recorder.run(step, modal.on_submit(interaction))
+
+    async def applicant(self, index):
+        main = self.main
+        await asyncio.sleep(self.rng.random() * self.args.ramp)
+        applicant = self.guild.add_member(f"applicant{index}")
+        await self.click("create_application", applicant, self.panel, "create_application")
+        application = main.active_applications.get_by_user(applicant.id)
+        if application is None:
+            return
+        channel = application.channel
+
+        answered = len(main.QUESTIONS)
+        if self.rng.random() < self.args.abandon_rate:
+            # Заброшенные заявки остаются открытыми до /bulkclose в конце
+            answered = self.rng.randrange(len(main.QUESTIONS))
+            self.abandoned += 1
+        for question_number in range(1, answered + 1):
+            await asyncio.sleep(self.rng.random() * self.args.think_time)
+            await self.answer(applicant, channel, index, question_number)
+        if answered < len(main.QUESTIONS):
+            return
+
+        decision = self.rng.random()
+        if decision < 0.2:
+            interaction = await self.click("request_more", self.moderator, channel, "request_more")
+            await self.submit_modal("request_more_submit", interaction.response.modal, channel, questions="4, 7", explanation="Подробнее")
+            for question_number in (4, 7):
+                await self.answer(applicant, channel, index, question_number)
+            decision = 0.3
+        if decision < 0.6:
+            interaction = await self.click("accept", self.moderator, channel, "accept")
+            await self.submit_modal("accept_submit", interaction.response.modal, channel, nickname=f"Player{index}")
+        elif decision < 0.9:
+            await self.click("reject", self.moderator, channel, "reject")
+            await self.submit_modal("reject_submit", main.RejectDetailsModal("слабая заявка", "да"), channel, nickname=f"Player{index}")
+        await self.click("close_application", self.moderator, channel, "close_application")
+        await self.recorder.run("close_complete", self.wait_deleted(channel))
+
+    async def wait_deleted(self, channel):
+        # Закрытие идёт в очереди задач, кнопка отвечает сразу
+        while not channel.deleted:
+            await asyncio.sleep(0.005)
+
+    async def run(self):
+        workers = self.install()
+        start = time.perf_counter()
+        await asyncio.gather(*(self.applicant(i) for i in range(self.args.applicants)))
+        await self.main.close_jobs.join()
+        if self.abandoned:
+            interaction = FakeInteraction(self.moderator, self.panel)
+            await self.recorder.run("bulk_close", self.main.bulkclose.callback(interaction, state="none"))
+        while self.main.background_tasks:
+            await asyncio.gather(*list(self.main.background_tasks), return_exceptions=True)
+        duration = time.perf_counter() - start
+        await self.main.state_store.flush()
+        for worker in workers:
+            worker.cancel()
+        await self.main.ticket_log.close()
+        self.work_dir.cleanup()
+        return duration
+
+
+async def simulate(args):
+    main = load_main()
+    simulation = Simulation(main, args)
+    duration = await simulation.run()
+    return {
+        "applicants": args.applicants,
+        "duration": duration,
+        "applicants_per_second": args.applicants / duration,
+        "steps": simulation.recorder.report(),
+        "rest_calls": simulation.guild.rest_calls,
+        "db_queries": main.mysql_pool.queries + main.mysql_lp_pool.queries,
+        "open_applications_left": len(main.active_applications),
+        "duplicate_interactions": sum(main.metrics.DUPLICATE_INTERACTIONS._values.values()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive concurrent applicants through the questionnaire against fake backends")
+    parser.add_argument("--applicants", type=int, default=200)
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds over which applicants arrive")
+    parser.add_argument("--think-time", type=float, default=0.0, help="max pause before each answer")
+    parser.add_argument("--attachment-rate", type=float, default=0.2)
+    parser.add_argument("--double-click-rate", type=float, default=0.0, help="share of button clicks delivered twice concurrently")
+    parser.add_argument("--abandon-rate", type=float, default=0.0, help="share of applicants who stop answering; closed with /bulkclose at the end")
+    parser.add_argument("--rest-latency", type=float, default=0.005)
+    parser.add_argument("--db-latency", type=float, default=0.001)
+    parser.add_argument("--download-latency", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--trace-memory", action="store_true", help="report Python heap peak via tracemalloc (slower)")
+    parser.add_argument("--output", help="write JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    if args.trace_memory:
+        tracemalloc.start()
+    report = asyncio.run(simulate(args))
+    if args.trace_memory:
+        report["peak_traced_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    report["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import io
+import json
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.fakes import (
+    FakeAttachment, FakeCategory, FakeChannel, FakeGuild, FakeMessage, FakePool, load_main
+)
+
+BENCHMARKS = []
+
+
+def benchmark(name, sizes):
+    def register(func):
+        BENCHMARKS.append((name, sizes, func))
+        return func
+    return register
+
+
+@benchmark("on_message_dispatch", sizes=(100, 1000, 10000))
+async def on_message_dispatch(main, size):
+    from ticket_log import TicketLog
+
+    guild = FakeGuild()
+    category = FakeCategory(guild)
+    author = guild.add_member("applicant")
+    channels = []
+    for i in range(size):
+        channel = await category.create_text_channel(f"заявка-{i:04d}")
+        application = main.Application(guild.add_member(f"user{i}"), channel)
+        application.collecting_response = True
+        main.active_applications.add(application)
+        channels.append(channel)
+    other_channels = [FakeChannel(guild, f"general-{i}") for i in range(10)]
+    rng = random.Random(size)
+    messages = [
+        (rng.choice(channels) if i % 2 else rng.choice(other_channels)).add_user_message(author, "ответ")
+        for i in range(1000)
+    ]
+
+    touched = {message.channel.id for message in messages} & {channel.id for channel in channels}
+    main.ticket_log = TicketLog(tempfile.mkdtemp(prefix="ticketbot-bench-"))
+
+    async def run():
+        for message in messages:
+            await main.on_message(message)
+        for channel_id in touched:
+            main.active_applications.get(channel_id).temp_messages.clear()
+
+    async def teardown():
+        for channel in channels:
+            main.active_applications.remove(channel.id)
+        await main.ticket_log.close()
+        shutil.rmtree(main.ticket_log.directory)
+
+    return run, teardown, len(messages)
+
+
+@benchmark("transcript_render", sizes=(100, 1000, 5000, 20000))
+async def transcript_render(main, size):
+    from discord import Embed
+    from transcript import message_record, render_transcript
+
+    guild = FakeGuild()
+    channel = FakeChannel(guild, "заявка-0001")
+    author = guild.add_member("applicant")
+    embed = Embed(title="Вопрос 1 из 9", description=main.QUESTIONS[0])
+    embed.add_field(name="1. Ваш ник", value="`Steve` <:ok:123456789012345678>")
+    messages = []
+    for i in range(size):
+        if i % 3 == 0:
+            messages.append(FakeMessage(channel, guild.me, embeds=[embed]))
+        else:
+            attachments = [FakeAttachment("screenshot.png", 1024)] if i % 10 == 1 else []
+            messages.append(FakeMessage(channel, author, f"Сообщение {i} <a:wave:123> & <b>", attachments=attachments))
+    records = [message_record(message) for message in messages]
+
+    async def run():
+        render_transcript(channel.name, records)
+
+    return run, None, len(messages)
+
+
+@benchmark("transcript_capture", sizes=(1000,))
+async def transcript_capture(main, size):
+    from ticket_log import TicketLog
+
+    guild = FakeGuild()
+    channel = FakeChannel(guild, "заявка-0001")
+    author = guild.add_member("applicant")
+    application = main.Application(author, channel)
+    main.active_applications.add(application)
+    ticket_log = main.ticket_log = TicketLog(tempfile.mkdtemp(prefix="ticketbot-bench-"))
+    messages = [channel.add_user_message(author, "ответ " * 50) for _ in range(size)]
+
+    async def run():
+        ticket_log.open(channel.id)
+        for message in messages:
+            await main.on_message(message)
+        await ticket_log.read(channel.id)
+        await ticket_log.delete(channel.id)
+        application.temp_messages.clear()
+
+    async def teardown():
+        main.active_applications.remove(channel.id)
+        await ticket_log.close()
+        shutil.rmtree(ticket_log.directory)
+
+    return run, teardown, size
+
+
+@benchmark("sync_sweep", sizes=(10000,))
+async def sync_sweep(main, size):
+    from lp_sync import LuckPermsSync
+
+    rows = [(i, f"user{i}", f"Player{i}", 0) for i in range(size)]
+    known = {f"player{i}": f"uuid-{i}" for i in range(size) if i % 10}
+
+    def whitelist(query, args):
+        if query.startswith("SELECT"):
+            return rows
+        return []
+
+    def luckperms(query, args):
+        if query.startswith("SELECT"):
+            return [(name, known[name]) for name in args if name in known]
+        return []
+
+    engine = LuckPermsSync(FakePool(whitelist), FakePool(luckperms))
+
+    async def run():
+        await engine.sweep("accept", "player")
+
+    return run, None, size
+
+
+async def summary_application(main, files):
+    from answers import Answer, AttachmentCache, StoredFile
+    from state_store import ApplicationStateStore
+
+    main.mysql_pool = FakePool(lambda query, args: [(1,)])
+    main.state_store = ApplicationStateStore(FakePool())
+    main.attachment_cache = AttachmentCache(tempfile.mkdtemp(prefix="ticketbot-bench-"), 1024 * 1024 * 1024)
+    guild = FakeGuild()
+    channel = FakeChannel(guild, "заявка-0001")
+    application = main.Application(guild.add_member("applicant"), channel)
+    for i, question in enumerate(main.QUESTIONS):
+        response_files = [
+            StoredFile(f"file{i}-{j}.png", None, 1024)
+            for j in range(files // len(main.QUESTIONS) + (1 if i < files % len(main.QUESTIONS) else 0))
+        ]
+        application.responses.append(Answer("`Steve`" if i == 1 else "ответ " * 50, response_files))
+    await cache_files(main, application)
+    return application
+
+
+async def cache_files(main, application):
+    for response in application.responses:
+        for file in response.files:
+            file.message_url = None
+            file.key = await main.attachment_cache.put(io.BytesIO(b"x" * file.size), file.size)
+
+
+async def summary_teardown(main):
+    shutil.rmtree(main.attachment_cache.directory)
+
+
+@benchmark("show_summary_initial", sizes=(10, 50, 200))
+async def show_summary_initial(main, size):
+    application = await summary_application(main, size)
+
+    async def run():
+        # Повторное кэширование входит в замер: после сводки файлы удаляются с диска
+        await cache_files(main, application)
+        await application.show_summary()
+
+    return run, lambda: summary_teardown(main), size
+
+
+@benchmark("show_summary_repeat", sizes=(10, 50, 200))
+async def show_summary_repeat(main, size):
+    application = await summary_application(main, size)
+    await application.show_summary()
+
+    async def run():
+        await application.show_summary()
+
+    return run, lambda: summary_teardown(main), size
+
+
+async def run_benchmarks(selected, repeat):
+    main = load_main()
+    results = []
+    for name, sizes, func in BENCHMARKS:
+        if selected and name not in selected:
+            continue
+        for size in sizes:
+            run, teardown, operations = await func(main, size)
+            await run()
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                await run()
+                timings.append(time.perf_counter() - start)
+            if teardown:
+                await teardown()
+            timings.sort()
+            median = statistics.median(timings)
+            results.append({
+                "name": name,
+                "size": size,
+                "repeat": repeat,
+                "min": timings[0],
+                "median": median,
+                "mean": statistics.fmean(timings),
+                "p95": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+                "ops_per_second": operations / median if median else None,
+            })
+            print(f"{name}[{size}]: median {median * 1000:.2f} ms", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    previous = {(entry["name"], entry["size"]): entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        old = previous.get((entry["name"], entry["size"]))
+        if not old:
+            continue
+        ratio = entry["median"] / old["median"] if old["median"] else float("inf")
+        entry["baseline_median"] = old["median"]
+        entry["ratio"] = ratio
+        if ratio > threshold:
+            regressions.append(entry)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the ticket bot hot paths")
+    parser.add_argument("--only", action="append", help="run only the named benchmark (repeatable)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON file produced by a previous run")
+    parser.add_argument("--threshold", type=float, default=1.2, help="median ratio that counts as a regression")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmarks(set(args.only or ()), args.repeat))
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        report["regressions"] = [(entry["name"], entry["size"], entry["ratio"]) for entry in regressions]
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from lp_sync import chunked, placeholders
+
+BATCH_SIZE = 500
+MAX_RANGE = 10000
+
+Ticket = namedtuple("Ticket", "id number channel_id username user_id nickname action created")
+
+
+def parse_numbers(text):
+    # «12, 15-20» -> {12, 15, 16, 17, 18, 19, 20}
+    numbers = set()
+    for part in text.replace(";", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = (int(value) for value in part.split("-", 1))
+            if end < start or end - start > MAX_RANGE:
+                raise ValueError(f"invalid range {part}")
+            numbers.update(range(start, end + 1))
+        else:
+            numbers.add(int(part))
+    return numbers
+
+
+async def select_tickets(pool, channel_ids, numbers=None, older_than_days=None, action=None):
+    conditions = []
+    args = []
+    if numbers:
+        conditions.append(f"application_number IN ({placeholders(len(numbers))})")
+        args.extend(sorted(numbers))
+    if older_than_days is not None:
+        conditions.append("create_datetime <= %s")
+        args.append(datetime.now() - timedelta(days=older_than_days))
+    if action:
+        conditions.append("action = %s")
+        args.append(action)
+    extra = "".join(f" AND {condition}" for condition in conditions)
+    tickets = []
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            for chunk in chunked(channel_ids, BATCH_SIZE):
+                await cur.execute(
+                    "SELECT id, application_number, channel_id, username, user_id, nickname, action, create_datetime "
+                    f"FROM whitelist WHERE channel_id IN ({placeholders(len(chunk))}){extra}",
+                    list(chunk) + args
+                )
+                tickets.extend(Ticket(*row) for row in await cur.fetchall())
+    tickets.sort(key=lambda ticket: ticket.number or 0)
+    return tickets
+
+
+async def update_decisions(pool, action, nicknames, when):
+    # Одно UPDATE на пачку: ник у каждой строки свой, поэтому через CASE;
+    # None оставляет ник, который уже записан.
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            for chunk in chunked(list(nicknames.items()), BATCH_SIZE):
+                cases = " ".join("WHEN %s THEN COALESCE(%s, nickname)" for _ in chunk)
+                await cur.execute(
+                    f"UPDATE whitelist SET action=%s, role_datetime=%s, nickname=CASE id {cases} END "
+                    f"WHERE id IN ({placeholders(len(chunk))})",
+                    [action, when] + [value for pair in chunk for value in pair] + [whitelist_id for whitelist_id, _ in chunk]
+                )
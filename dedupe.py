@@ -0,0 +1,17 @@
+class InteractionDeduplicator:
+    # Повторное нажатие той же кнопки тем же пользователем, пока первое ещё
+    # обрабатывается, отбрасывается без повторной работы. После завершения
+    # нажатие ничего не блокирует: отказ в правах или ошибка проверки не
+    # должны мешать следующей попытке, а повтор уже выполненного действия
+    # отсекает блокировка заявки.
+    def __init__(self):
+        self._running = set()
+
+    def begin(self, key):
+        if key in self._running:
+            return False
+        self._running.add(key)
+        return True
+
+    def end(self, key):
+        self._running.discard(key)
@@ -0,0 +1,80 @@
+import asyncio
+import tempfile
+
+import aiohttp
+
+from metrics import ATTACHMENT_BYTES
+
+CHUNK_SIZE = 64 * 1024
+
+
+class TicketBudget:
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+
+    def reserve(self, size):
+        if self.used + size > self.limit:
+            return False
+        self.used += size
+        return True
+
+    def release(self, size):
+        self.used = max(0, self.used - size)
+
+
+class AttachmentDownloader:
+    def __init__(self, max_concurrency=4, max_file_size=25 * 1024 * 1024, spool_threshold=1024 * 1024):
+        self.max_concurrency = max_concurrency
+        self.max_file_size = max_file_size
+        self.spool_threshold = spool_threshold
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency * 2, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=120, sock_read=30)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def download(self, attachment, budget):
+        # Резервируем объём заранее по размеру, который сообщает Discord,
+        # чтобы параллельные загрузки не превысили лимит заявки.
+        if attachment.size > self.max_file_size or not budget.reserve(attachment.size):
+            return None
+        reserved = attachment.size
+        data = tempfile.SpooledTemporaryFile(max_size=self.spool_threshold)
+        received = 0
+        try:
+            async with self._semaphore:
+                async with self._get_session().get(attachment.url) as resp:
+                    if resp.status != 200:
+                        raise aiohttp.ClientResponseError(resp.request_info, resp.history, status=resp.status)
+                    async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                        received += len(chunk)
+                        if received > self.max_file_size:
+                            raise ValueError(f"attachment {attachment.filename} exceeds file size limit")
+                        if received > reserved:
+                            if not budget.reserve(received - reserved):
+                                raise ValueError(f"attachment {attachment.filename} exceeds ticket size limit")
+                            reserved = received
+                        data.write(chunk)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            data.close()
+            budget.release(reserved)
+            return None
+        budget.release(reserved - received)
+        ATTACHMENT_BYTES.inc(received)
+        data.seek(0)
+        return {"filename": attachment.filename, "url": attachment.url, "data": data, "size": received}
+
+    async def download_all(self, attachments, budget):
+        return await asyncio.gather(*(self.download(attachment, budget) for attachment in attachments))
@@ -0,0 +1,93 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+log = logging.getLogger('ticketbot.expiry')
+
+REMIND = "remind"
+EXPIRE = "expire"
+
+
+class ExpiryScheduler:
+    # Одна куча таймеров на все заявки. touch() не ищет старую запись в
+    # куче, а выдаёт новое поколение; устаревшие записи отбрасываются при
+    # извлечении, поэтому каждое событие стоит O(log n).
+    def __init__(self, reminder_after, close_after, on_remind, on_expire):
+        self.reminder_after = reminder_after
+        self.close_after = close_after
+        self.on_remind = on_remind
+        self.on_expire = on_expire
+        self._heap = []
+        self._entries = {}
+        self._generations = itertools.count()
+        self._wakeup = None
+        self._tasks = set()
+
+    @property
+    def enabled(self):
+        return self.reminder_after > 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _push(self, key, deadline, stage):
+        generation = next(self._generations)
+        self._entries[key] = (deadline, generation, stage)
+        earliest = not self._heap or deadline < self._heap[0][0]
+        heapq.heappush(self._heap, (deadline, generation, key))
+        if earliest and self._wakeup is not None:
+            self._wakeup.set()
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._compact()
+
+    def _compact(self):
+        self._heap = [(deadline, generation, key) for key, (deadline, generation, _) in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    def touch(self, key):
+        if self.enabled:
+            self._push(key, time.monotonic() + self.reminder_after, REMIND)
+
+    def cancel(self, key):
+        self._entries.pop(key, None)
+
+    def _fire(self, callback, key):
+        task = asyncio.ensure_future(self._call(callback, key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _call(self, callback, key):
+        try:
+            await callback(key)
+        except Exception:
+            log.exception("Error handling inactivity timer", extra={"channel_id": key})
+
+    def _pop_due(self, now):
+        while self._heap and self._heap[0][0] <= now:
+            _, generation, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != generation:
+                continue
+            if entry[2] == REMIND:
+                self._push(key, now + self.close_after, EXPIRE)
+                self._fire(self.on_remind, key)
+            else:
+                del self._entries[key]
+                self._fire(self.on_expire, key)
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            self._pop_due(now)
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
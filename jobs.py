@@ -0,0 +1,122 @@
+import asyncio
+import logging
+
+import aiohttp
+import aiomysql
+import discord
+
+log = logging.getLogger('ticketbot.jobs')
+
+# Ошибки, после которых задачу имеет смысл повторить
+TRANSIENT_ERRORS = (
+    discord.DiscordServerError,
+    aiomysql.OperationalError,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+
+class Job:
+    # run() должен быть идемпотентным: при повторе он продолжает с этапа,
+    # на котором произошла ошибка, и может вернуть False, если выполнить
+    # задачу нельзя. После постановки в очередь `done` завершается True
+    # или False в зависимости от результата.
+    done = None
+
+    async def run(self):
+        raise NotImplementedError
+
+    async def retrying(self, attempt, delay, error):
+        pass
+
+    async def failed(self, error):
+        pass
+
+
+class JobQueue:
+    # Долгая работа по нажатию кнопки выполняется ограниченным числом
+    # воркеров, чтобы пачка одновременных запросов не делила между собой
+    # rate limit Discord и соединения MySQL.
+    def __init__(self, name, concurrency=2, max_attempts=3, retry_delay=5.0, transient=TRANSIENT_ERRORS):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.transient = transient
+        self._queue = None
+        self._workers = []
+        self._keys = set()
+        self.in_flight = 0
+
+    def _start(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        while len(self._workers) < self.concurrency:
+            self._workers.append(asyncio.ensure_future(self._worker()))
+
+    def depth(self):
+        return self._queue.qsize() if self._queue else 0
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def submit(self, key, job):
+        # Возвращает число задач впереди или None, если задача с этим
+        # ключом уже в очереди.
+        if key in self._keys:
+            return None
+        self._start()
+        ahead = self._queue.qsize() + self.in_flight
+        self._keys.add(key)
+        job.done = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((key, job))
+        return ahead
+
+    async def join(self):
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def _worker(self):
+        while True:
+            key, job = await self._queue.get()
+            self.in_flight += 1
+            succeeded = False
+            try:
+                succeeded = await self._run(key, job)
+            finally:
+                if not job.done.done():
+                    job.done.set_result(succeeded)
+                self.in_flight -= 1
+                self._keys.discard(key)
+                self._queue.task_done()
+
+    async def _run(self, key, job):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return await job.run() is not False
+            except self.transient as e:
+                if attempt == self.max_attempts:
+                    log.exception("%s job %s failed after %d attempts", self.name, key, attempt)
+                    await self._notify(job.failed(e))
+                    return False
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                log.warning("%s job %s failed (attempt %d/%d), retrying in %.0fs: %s", self.name, key, attempt, self.max_attempts, delay, e)
+                await self._notify(job.retrying(attempt, delay, e))
+                await asyncio.sleep(delay)
+            except Exception as e:
+                log.exception("%s job %s failed", self.name, key)
+                await self._notify(job.failed(e))
+                return False
+
+    async def _notify(self, coro):
+        try:
+            await coro
+        except Exception:
+            log.exception("Error reporting %s job status", self.name)
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
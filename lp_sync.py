@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import time
+
+from metrics import SYNC_BACKLOG, SYNC_SWEEP_DURATION
+
+log = logging.getLogger('ticketbot.sync')
+
+BATCH_SIZE = 500
+UNKNOWN_NICKNAME = "неизвестно"
+
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def placeholders(count):
+    return ", ".join(["%s"] * count)
+
+
+class LuckPermsSync:
+    def __init__(self, pool, lp_pool, batch_size=BATCH_SIZE, max_attempts=10, retry_base_delay=60, retry_max_delay=86400):
+        self.pool = pool
+        self.lp_pool = lp_pool
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+
+    async def fetch_pending(self, action, channel_ids=None):
+        query = (
+            "SELECT w.id, w.username, w.nickname, COALESCE(r.attempts, 0) FROM whitelist w "
+            "LEFT JOIN whitelist_sync_retry r ON r.whitelist_id = w.id "
+            "WHERE w.action=%s AND w.`join`=%s"
+        )
+        args = [action, 0]
+        if channel_ids:
+            # Явное решение модератора — новая попытка, минуя backoff, но не
+            # для строк в dead letter: их возвращает только /syncretry
+            query += f" AND w.channel_id IN ({placeholders(len(channel_ids))}) AND (r.whitelist_id IS NULL OR r.dead = 0)"
+            args.extend(channel_ids)
+        else:
+            query += " AND (r.whitelist_id IS NULL OR (r.dead = 0 AND r.next_attempt_at <= NOW()))"
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(query, args)
+                return await cur.fetchall()
+
+    async def sweep(self, action, group, channel_ids=None):
+        start = time.perf_counter()
+        rows = await self.fetch_pending(action, channel_ids)
+        if not channel_ids:
+            SYNC_BACKLOG.set(len(rows), action=action)
+        synced = 0
+        for batch in chunked(rows, self.batch_size):
+            synced += await self.sync_batch(action, group, batch)
+        SYNC_SWEEP_DURATION.observe(time.perf_counter() - start, action=action)
+        return synced
+
+    async def sync_batch(self, action, group, rows):
+        pending = {}
+        failures = []
+        for row_id, username, nickname, attempts in rows:
+            nickname = (nickname or "").strip().lower()
+            if not nickname or nickname == UNKNOWN_NICKNAME:
+                log.info("Skipping user %s: nickname not specified", username, extra={"action": action})
+                failures.append((row_id, attempts, "nickname not specified"))
+                continue
+            pending.setdefault(nickname, []).append((row_id, attempts))
+        if not pending:
+            await self.record_failures(failures)
+            return 0
+
+        nicknames = list(pending)
+        permission_value = f"group.{group}"
+        async with self.lp_pool.acquire() as lp_conn:
+            async with lp_conn.cursor() as lp_cur:
+                await lp_cur.execute(
+                    f"SELECT username, uuid FROM luckperms_players WHERE username IN ({placeholders(len(nicknames))})",
+                    nicknames
+                )
+                uuids = {username.lower(): uuid for username, uuid in await lp_cur.fetchall()}
+                if uuids:
+                    await lp_cur.executemany(
+                        "INSERT IGNORE INTO luckperms_user_permissions (uuid, permission, value, server, world, expiry, contexts) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                        [(uuid, permission_value, 1, 'global', 'global', 0, '{}') for uuid in uuids.values()]
+                    )
+
+        for nickname in nicknames:
+            if nickname not in uuids:
+                log.info("Nickname %s not found in LuckPerms DB", nickname, extra={"action": action})
+                failures.extend((row_id, attempts, "nickname not found in LuckPerms") for row_id, attempts in pending[nickname])
+        await self.record_failures(failures)
+
+        synced = [(row_id, attempts) for nickname in uuids for row_id, attempts in pending[nickname]]
+        if not synced:
+            return 0
+        row_ids = [row_id for row_id, _ in synced]
+        retried_ids = [row_id for row_id, attempts in synced if attempts]
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(f"UPDATE whitelist SET `join`=%s WHERE id IN ({placeholders(len(row_ids))})", [1, *row_ids])
+                if retried_ids:
+                    await cur.execute(f"DELETE FROM whitelist_sync_retry WHERE whitelist_id IN ({placeholders(len(retried_ids))})", retried_ids)
+        log.info("Granted %s to %d user(s)", permission_value, len(row_ids), extra={"action": action})
+        return len(row_ids)
+
+    async def record_failures(self, failures):
+        if not failures:
+            return
+        params = []
+        for row_id, attempts, error in failures:
+            attempts += 1
+            delay = min(self.retry_base_delay * 2 ** (attempts - 1), self.retry_max_delay)
+            dead = 1 if attempts >= self.max_attempts else 0
+            if dead:
+                log.warning("Whitelist row %s moved to dead letter after %d attempts: %s", row_id, attempts, error)
+            params.append((row_id, attempts, delay, dead, error))
+        # Время следующей попытки считает MySQL: с ним же сравнивает
+        # fetch_pending, и часы или часовой пояс бота не влияют на backoff
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                for chunk in chunked(params, self.batch_size):
+                    values = ", ".join("(%s, %s, NOW() + INTERVAL %s SECOND, %s, %s)" for _ in chunk)
+                    await cur.execute(
+                        f"INSERT INTO whitelist_sync_retry (whitelist_id, attempts, next_attempt_at, dead, last_error) VALUES {values} "
+                        "ON DUPLICATE KEY UPDATE attempts=VALUES(attempts), next_attempt_at=VALUES(next_attempt_at), dead=VALUES(dead), last_error=VALUES(last_error)",
+                        [value for row in chunk for value in row]
+                    )
+
+    async def fetch_dead_letters(self, limit=25):
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "SELECT w.application_number, w.username, w.nickname, w.action, r.attempts, r.last_error "
+                    "FROM whitelist_sync_retry r JOIN whitelist w ON w.id = r.whitelist_id "
+                    "WHERE r.dead = 1 ORDER BY r.next_attempt_at LIMIT %s",
+                    (limit,)
+                )
+                return await cur.fetchall()
+
+    async def retry_dead_letters(self, application_number=None):
+        query = (
+            "SELECT w.id, w.action, w.channel_id FROM whitelist_sync_retry r "
+            "JOIN whitelist w ON w.id = r.whitelist_id WHERE r.dead = 1"
+        )
+        args = []
+        if application_number is not None:
+            query += " AND w.application_number = %s"
+            args.append(application_number)
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(query, args)
+                rows = await cur.fetchall()
+                if rows:
+                    await cur.execute(
+                        f"DELETE FROM whitelist_sync_retry WHERE whitelist_id IN ({placeholders(len(rows))})",
+                        [row[0] for row in rows]
+                    )
+        return [(action, channel_id) for _, action, channel_id in rows]
+
+
+class LuckPermsSyncQueue:
+    def __init__(self, engine, targets, min_interval=30, max_interval=600):
+        self.engine = engine
+        self.groups = dict(targets)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.queue = asyncio.Queue()
+
+    def push(self, action, channel_id):
+        if action in self.groups:
+            self.queue.put_nowait((action, channel_id))
+
+    async def run_worker(self):
+        while True:
+            jobs = [await self.queue.get()]
+            while not self.queue.empty():
+                jobs.append(self.queue.get_nowait())
+            channels_by_action = {}
+            for action, channel_id in jobs:
+                channels_by_action.setdefault(action, set()).add(channel_id)
+            for action, channel_ids in channels_by_action.items():
+                try:
+                    await self.engine.sweep(action, self.groups[action], list(channel_ids))
+                except Exception:
+                    log.exception("Error in LuckPerms sync worker", extra={"action": action})
+
+    async def run_reconciler(self):
+        # Запасной проход для строк, записанных другими процессами или
+        # оставшихся после падения: интервал растёт, пока работы нет.
+        interval = self.min_interval
+        while True:
+            await asyncio.sleep(interval)
+            synced = 0
+            for action, group in self.groups.items():
+                try:
+                    synced += await self.engine.sweep(action, group)
+                except Exception:
+                    log.exception("Error in LuckPerms reconciliation", extra={"action": action})
+            interval = self.min_interval if synced else min(interval * 2, self.max_interval)
+
+    async def retry_dead_letters(self, application_number=None):
+        jobs = await self.engine.retry_dead_letters(application_number)
+        for action, channel_id in jobs:
+            self.push(action, channel_id)
+        return len(jobs)
@@ -3,13 +3,34 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 from dotenv import load_dotenv
+import io
 import json
+import hashlib
 import asyncio
-import aiohttp
-import io
+import contextlib
+import logging
+import time
 import aiomysql
-from datetime import datetime
-import re
+from datetime import datetime, timedelta
+
+from registry import ApplicationRegistry
+from downloader import AttachmentDownloader, TicketBudget
+from transcript import TranscriptWriter, message_record, render_transcript
+from ticket_log import TicketLog
+from lp_sync import LuckPermsSync, LuckPermsSyncQueue
+from migrations import migrate
+from state_store import ApplicationStateStore
+from bulk import parse_numbers, select_tickets, update_decisions
+from archive import ApplicationArchive, answers_text, parse_date
+from jobs import Job, JobQueue, TRANSIENT_ERRORS
+from expiry import ExpiryScheduler
+from dedupe import InteractionDeduplicator
+from rest_scheduler import RestScheduler, NORMAL, BACKGROUND
+from auth import AdminRoleCache
+from answers import Answer, AttachmentCache, PendingMessage, StoredFile
+from summary import answer_fields, paginate_fields, batch_files, reference_messages
+import metrics
+from logging_setup import setup_logging, RateLimitFilter
 
 load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
@@ -19,11 +40,98 @@ ARCHIVE_CHANNEL_ID = int(os.getenv('ARCHIVE_CHANNEL_ID'))
 MYSQL_LP_DB = os.getenv('MYSQL_LP_DB')
 ACCEPT_ROLE = os.getenv('ACCEPT_ROLE')
 REJECT_ROLE = os.getenv('REJECT_ROLE')
+SYNC_TARGETS = (('accept', ACCEPT_ROLE), ('rejected', REJECT_ROLE))
+SYNC_RECONCILE_MIN_INTERVAL = int(os.getenv('SYNC_RECONCILE_MIN_INTERVAL', '30'))
+SYNC_RECONCILE_MAX_INTERVAL = int(os.getenv('SYNC_RECONCILE_MAX_INTERVAL', '600'))
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_RATE_LIMIT_BURST = int(os.getenv('LOG_RATE_LIMIT_BURST', '10'))
+LOG_RATE_LIMIT_INTERVAL = float(os.getenv('LOG_RATE_LIMIT_INTERVAL', '60'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+REST_BACKGROUND_CONCURRENCY = int(os.getenv('REST_BACKGROUND_CONCURRENCY', '2'))
+REST_NORMAL_CONCURRENCY = int(os.getenv('REST_NORMAL_CONCURRENCY', '2'))
+APPLICATION_STATE_FLUSH_INTERVAL = int(os.getenv('APPLICATION_STATE_FLUSH_INTERVAL', '5'))
+SYNC_MAX_ATTEMPTS = int(os.getenv('SYNC_MAX_ATTEMPTS', '10'))
+SYNC_RETRY_BASE_DELAY = int(os.getenv('SYNC_RETRY_BASE_DELAY', '60'))
+SYNC_RETRY_MAX_DELAY = int(os.getenv('SYNC_RETRY_MAX_DELAY', '86400'))
+DOWNLOAD_CONCURRENCY = int(os.getenv('DOWNLOAD_CONCURRENCY', '4'))
+MAX_ATTACHMENT_SIZE = int(os.getenv('MAX_ATTACHMENT_SIZE', str(25 * 1024 * 1024)))
+MAX_TICKET_ATTACHMENTS_SIZE = int(os.getenv('MAX_TICKET_ATTACHMENTS_SIZE', str(100 * 1024 * 1024)))
+MYSQL_POOL_MIN_SIZE = int(os.getenv('MYSQL_POOL_MIN_SIZE', '2'))
+MYSQL_POOL_MAX_SIZE = int(os.getenv('MYSQL_POOL_MAX_SIZE', '10'))
+ATTACHMENT_CACHE_DIR = os.getenv('ATTACHMENT_CACHE_DIR', 'attachment_cache')
+ATTACHMENT_CACHE_SIZE = int(os.getenv('ATTACHMENT_CACHE_SIZE', str(1024 * 1024 * 1024)))
+CLOSE_CONCURRENCY = int(os.getenv('CLOSE_CONCURRENCY', '2'))
+CLOSE_MAX_ATTEMPTS = int(os.getenv('CLOSE_MAX_ATTEMPTS', '3'))
+CLOSE_RETRY_DELAY = float(os.getenv('CLOSE_RETRY_DELAY', '5'))
+INACTIVITY_REMINDER_TIMEOUT = int(os.getenv('INACTIVITY_REMINDER_TIMEOUT', '86400'))
+INACTIVITY_CLOSE_TIMEOUT = int(os.getenv('INACTIVITY_CLOSE_TIMEOUT', '86400'))
+TRANSCRIPT_LOG_DIR = os.getenv('TRANSCRIPT_LOG_DIR', 'transcripts')
+TRANSCRIPT_LOG_FLUSH_INTERVAL = float(os.getenv('TRANSCRIPT_LOG_FLUSH_INTERVAL', '2'))
+
+# Discord удаляет пачкой только сообщения моложе 14 дней; запас на расхождение часов
+BULK_DELETE_MAX_AGE = timedelta(days=14) - timedelta(minutes=5)
+
+worker_tasks = []
+
+class TicketBot(commands.Bot):
+    async def setup_hook(self):
+        # Вызывается один раз до подключения к gateway, в отличие от on_ready,
+        # который срабатывает при каждом переподключении.
+        global sync_queue
+        await init_mysql()
+        await restore_attachment_cache()
+        sync_queue = LuckPermsSyncQueue(
+            LuckPermsSync(
+                mysql_pool,
+                mysql_lp_pool,
+                max_attempts=SYNC_MAX_ATTEMPTS,
+                retry_base_delay=SYNC_RETRY_BASE_DELAY,
+                retry_max_delay=SYNC_RETRY_MAX_DELAY
+            ),
+            SYNC_TARGETS,
+            min_interval=SYNC_RECONCILE_MIN_INTERVAL,
+            max_interval=SYNC_RECONCILE_MAX_INTERVAL
+        )
+        worker_tasks.extend([
+            asyncio.create_task(sync_queue.run_worker()),
+            asyncio.create_task(sync_queue.run_reconciler()),
+            asyncio.create_task(state_store.run()),
+            asyncio.create_task(ticket_log.run()),
+            asyncio.create_task(expiry.run()),
+        ])
+        await start_metrics_server()
+        try:
+            await sync_command_tree()
+        except Exception:
+            log.exception("Error syncing command tree")
+
+    async def close(self):
+        for task in worker_tasks:
+            task.cancel()
+        if state_store is not None:
+            try:
+                await state_store.flush()
+            except Exception:
+                log.exception("Error flushing application state on shutdown")
+        try:
+            await ticket_log.close()
+        except Exception:
+            log.exception("Error writing ticket logs on shutdown")
+        await close_jobs.close()
+        await downloader.close()
+        await rest_scheduler.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await close_mysql()
+        await super().close()
 
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+bot = TicketBot(command_prefix='!', intents=intents, http_trace=metrics.http_trace())
+log = logging.getLogger('ticketbot')
+metrics.instrument_http(bot.http)
 
 QUESTIONS = [
     "Ваш возраст. (полных лет)",
@@ -37,16 +145,6 @@ QUESTIONS = [
     "Есть ли у вас при необходимости возможность пойти в голосовой канал с администратором?"
 ]
 
-emoji_pattern = r"<(a?):(\w+):(\d+)>"
-
-def replace_emoji(match):
-    is_animated = match.group(1)
-    emoji_name = match.group(2)
-    emoji_id = match.group(3)
-    extension = 'gif' if is_animated else 'png'
-    emoji_url = f'https://cdn.discordapp.com/emojis/{emoji_id}.{extension}'
-    return f"<img src='{emoji_url}' alt=':{emoji_name}:' style='vertical-align: middle; height: 1em;'>"
-
 class ApplicationView(discord.ui.View):
     def __init__(self):
         super().__init__(timeout=None)
@@ -78,9 +176,10 @@ class RequestMoreModal(discord.ui.Modal, title="Попросить дополн
     async def on_submit(self, interaction: discord.Interaction):
         question_numbers = [int(num.strip()) for num in self.questions.value.split(',') if num.strip().isdigit()]
         explanation = self.explanation.value
-        application = next((app for app in active_applications if app.channel == interaction.channel), None)
+        application = await get_application(interaction.channel)
         if application:
-            await application.request_more(interaction.user, question_numbers, explanation)
+            async with application.lock:
+                await application.request_more(interaction.user, question_numbers, explanation)
         await interaction.response.send_message("Запрос на дополнение отправлен!", ephemeral=True)
 
 class Application:
@@ -91,8 +190,47 @@ class Application:
         self.current_question = 0
         self.collecting_response = False
         self.temp_messages = []
+        self.cleanup_message_ids = []
+        # Сообщения с вложениями, ещё не загруженными в сводку
+        self.held_message_ids = []
+        self.attachments_budget = TicketBudget(MAX_TICKET_ATTACHMENTS_SIZE)
+        # Переходы состояния заявки выполняются по одному
+        self.lock = asyncio.Lock()
+        self.decision = None
+        self.closed = False
+
+    def to_state(self):
+        return {
+            "current_question": self.current_question,
+            "collecting_response": self.collecting_response,
+            "responses": [response.to_state() for response in self.responses],
+            "attachments_used": self.attachments_budget.used,
+            "cleanup_message_ids": self.cleanup_message_ids,
+            "held_message_ids": self.held_message_ids,
+            "additional_questions": getattr(self, 'additional_questions', None),
+            "additional_explanation": getattr(self, 'additional_explanation', None),
+            "current_additional_index": getattr(self, 'current_additional_index', 0),
+            "additional_answers": {str(q): a.to_state() for q, a in getattr(self, 'additional_answers', {}).items()},
+        }
+
+    @classmethod
+    def from_state(cls, user, channel, state):
+        application = cls(user, channel)
+        application.current_question = state["current_question"]
+        application.collecting_response = state["collecting_response"]
+        application.responses = [Answer.from_state(response) for response in state["responses"]]
+        application.attachments_budget.used = state["attachments_used"]
+        application.cleanup_message_ids = state.get("cleanup_message_ids", [])
+        application.held_message_ids = state.get("held_message_ids", [])
+        if state["additional_questions"] is not None:
+            application.additional_questions = state["additional_questions"]
+            application.additional_explanation = state["additional_explanation"]
+            application.current_additional_index = state["current_additional_index"]
+            application.additional_answers = {int(q): Answer.from_state(a) for q, a in state["additional_answers"].items()}
+        return application
 
     async def start(self):
+        state_store.mark_dirty(self)
         await self.ask_question()
 
     async def ask_question(self):
@@ -105,86 +243,161 @@ class Application:
             embed.set_footer(text="Отправьте ваш ответ в чат и нажмите кнопку 'Отправить'")
             
             view = ApplicationResponseView()
-            await self.channel.send(embed=embed, view=view)
+            prompt = await self.channel.send(embed=embed, view=view)
+            self.cleanup_message_ids.append(prompt.id)
             self.collecting_response = True
+            expiry.touch(self.channel.id)
         else:
             await self.show_summary()
 
     def get_media_url(self, attachment):
         return attachment.url.replace('cdn.discordapp.com', 'media.discordapp.net')
 
-    async def add_response(self, messages):
+    async def collect_response(self, messages):
         response_parts = []
         files = []
+        attachments = [attachment for message in messages for attachment in message.attachments]
+        downloaded = iter(await asyncio.gather(*(
+            self.store_file(file)
+            for file in await downloader.download_all(attachments, self.attachments_budget)
+        )))
         for message in messages:
             if message.content:
                 response_parts.append(message.content)
             for attachment in message.attachments:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(attachment.url) as resp:
-                        if resp.status == 200:
-                            data = io.BytesIO(await resp.read())
-                            data.seek(0)
-                            files.append({"filename": attachment.filename, "data": data})
-                file_link = f"[{attachment.filename}](файл будет приложен ниже)"
+                file = next(downloaded)
+                if file:
+                    file.message_id = message.id
+                    files.append(file)
+                    file_link = f"[{attachment.filename}](файл будет приложен ниже)"
+                else:
+                    file_link = f"[{attachment.filename}](файл слишком большой или недоступен)"
                 response_parts.append(file_link)
             if message.attachments and any(att.content_type and att.content_type.startswith('audio/') for att in message.attachments):
                 response_parts.append("[Голосовое сообщение]")
-        full_response = "\n".join(response_parts)
-        self.responses.append({"text": full_response, "files": files, "messages": messages})
+        return "\n".join(response_parts), files
+
+    async def store_file(self, downloaded):
+        # Содержимое уходит в кэш на диске, в памяти остаются только метаданные
+        if downloaded is None:
+            return None
+        try:
+            key = await attachment_cache.put(downloaded["data"], downloaded["size"])
+        finally:
+            downloaded["data"].close()
+        return StoredFile(downloaded["filename"], downloaded["url"], downloaded["size"], key=key)
+
+    def release_files(self):
+        answers = self.responses + list(getattr(self, 'additional_answers', {}).values())
+        for answer in answers:
+            for file in answer.files:
+                if file.key is not None:
+                    attachment_cache.discard(file.key)
+                    file.key = None
+
+    def schedule_cleanup(self, messages, files):
+        # Сообщения с сохранёнными вложениями удаляются только после сводки:
+        # до этого файл доступен лишь по их ссылке (после перезапуска или
+        # вытеснения из кэша).
+        held = {file.message_id for file in files}
+        self.held_message_ids.extend(message_id for message_id in held if message_id not in self.held_message_ids)
+        message_ids = self.cleanup_message_ids + [message.id for message in messages if message.id not in held]
+        self.cleanup_message_ids = []
+        run_in_background(self.delete_messages(message_ids))
+
+    async def delete_messages(self, message_ids):
+        # Bulk delete принимает не больше 100 сообщений за запрос и только не
+        # старше 14 дней; более старые и те, что не удалились пачкой,
+        # удаляются по одному.
+        cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+        recent = [message_id for message_id in message_ids if discord.utils.snowflake_time(message_id) > cutoff]
+        single = [message_id for message_id in message_ids if discord.utils.snowflake_time(message_id) <= cutoff]
+        for i in range(0, len(recent), 100):
+            chunk = recent[i:i + 100]
+            try:
+                await rest_scheduler.submit(BACKGROUND, self.channel.delete_messages, [discord.Object(id=message_id) for message_id in chunk])
+            except discord.HTTPException as e:
+                log.warning("Error bulk deleting messages, deleting one by one: %s", e, extra={"channel_id": self.channel.id, "user_id": self.user.id})
+                single.extend(chunk)
+        for message_id in single:
+            try:
+                await rest_scheduler.submit(BACKGROUND, self.channel.get_partial_message(message_id).delete)
+            except discord.NotFound:
+                pass
+            except discord.HTTPException as e:
+                log.warning("Error deleting message: %s", e, extra={"channel_id": self.channel.id, "user_id": self.user.id})
+
+    async def add_response(self, messages):
+        full_response, files = await self.collect_response(messages)
+        self.responses.append(Answer(full_response, files, [message.id for message in messages]))
         self.current_question += 1
         self.temp_messages = []
         self.collecting_response = False
-        await self.channel.purge(limit=None)
+        self.schedule_cleanup(messages, files)
+        state_store.mark_dirty(self)
         await self.ask_question()
 
     async def show_summary(self):
-        application_number = 0
-        async with mysql_pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                await cur.execute("SELECT application_number FROM whitelist WHERE channel_id=%s", (self.channel.id,))
-                result = await cur.fetchone()
-                if result:
-                    application_number = result[0]
+        # Дальше ход за модератором, заявитель больше не отвечает
+        expiry.cancel(self.channel.id)
 
-        embed = discord.Embed(
-            title=f"Анкета",
-            description="Результаты заполнения анкеты",
-            color=discord.Color.green()
-        )
-
-        nickname_raw = self.responses[1]["text"]
+        nickname_raw = self.responses[1].text
         nickname_cleaned = nickname_raw.strip().replace('`', '')
 
         avatar_url = f"https://minotar.net/avatar/{nickname_cleaned}/100"
 
-        embed.set_thumbnail(url=avatar_url)
+        def make_embed(page):
+            if page:
+                return discord.Embed(title=f"Анкета (часть {page + 1})", color=discord.Color.green())
+            embed = discord.Embed(
+                title=f"Анкета",
+                description="Результаты заполнения анкеты",
+                color=discord.Color.green()
+            )
+            embed.set_thumbnail(url=avatar_url)
+            return embed
 
+        embeds = paginate_fields(answer_fields(QUESTIONS, self.responses), make_embed)
         view = ApplicationReviewView()
-        all_files = []
-        for i, (question, response) in enumerate(zip(QUESTIONS, self.responses), 1):
-            text = response["text"]
-            if len(text) > 1024:
-                chunks = [text[i:i+1024] for i in range(0, len(text), 1024)]
-                for j, chunk in enumerate(chunks):
-                    embed.add_field(
-                        name=f"{i}. {question}" if j == 0 else f"Продолжение ответа {i}",
-                        value=chunk,
-                        inline=False
-                    )
-            else:
-                embed.add_field(
-                    name=f"{i}. {question}",
-                    value=text if text else "[нет ответа]",
-                    inline=False
-                )
-            if "files" in response:
-                all_files.extend(response["files"])
-        await self.channel.send(embed=embed, view=view)
-        # Отправляем все файлы как attachments
-        for file in all_files:
-            file['data'].seek(0)
-            await self.channel.send(file=discord.File(file['data'], file['filename']))
+        for embed in embeds[:-1]:
+            await self.channel.send(embed=embed)
+        await self.channel.send(embed=embeds[-1], view=view)
+
+        # Новые файлы отправляются пачками по 10, а уже загруженные при
+        # предыдущей сводке или вытесненные из кэша — ссылками.
+        size_limit = self.channel.guild.filesize_limit
+        all_files = [file for response in self.responses for file in response.files]
+        to_upload = [file for file in all_files if file.key is not None and not file.message_url and file.size <= size_limit]
+        uploading = {id(file) for file in to_upload}
+        references = [file for file in all_files if id(file) not in uploading]
+        for batch in batch_files(to_upload, size_limit):
+            opened = [(file, attachment_cache.open(file.key)) for file in batch]
+            references.extend(file for file, data in opened if data is None)
+            opened = [(file, data) for file, data in opened if data is not None]
+            if not opened:
+                continue
+            message = await rest_scheduler.submit(
+                NORMAL,
+                self.channel.send,
+                files=[discord.File(data, file.filename) for file, data in opened]
+            )
+            for file, _ in opened:
+                file.message_url = message.jump_url
+        # Уже загруженные в прошлую сводку и те, что загрузить не удалось,
+        # перечисляются отдельно
+        for content in reference_messages([file for file in references if file.message_url]):
+            await self.channel.send(content)
+        for content in reference_messages([file for file in references if not file.message_url], header="Не удалось приложить файлы:"):
+            await self.channel.send(content)
+        # Загруженные файлы дальше доступны по ссылке, копия на диске не нужна.
+        # Сообщения заявителя остаются только для файлов, не попавших в сводку.
+        self.release_files()
+        not_uploaded = {file.message_id for file in all_files if not file.message_url}
+        released = [message_id for message_id in self.held_message_ids if message_id not in not_uploaded]
+        self.held_message_ids = [message_id for message_id in self.held_message_ids if message_id in not_uploaded]
+        if released:
+            run_in_background(self.delete_messages(released))
+        state_store.mark_dirty(self)
 
     async def request_more(self, moderator, question_numbers, explanation):
         self.additional_questions = question_numbers
@@ -197,8 +410,10 @@ class Application:
             f"Пояснение: {explanation}\n"
             "Пожалуйста, отправьте ваши дополнения по очереди на каждый вопрос. После каждого ответа нажимайте кнопку 'Отправить'."
         )
-        await self.channel.send(msg)
+        request_message = await self.channel.send(msg)
+        self.cleanup_message_ids.append(request_message.id)
         self.current_additional_index = 0
+        state_store.mark_dirty(self)
         await self.ask_additional_question()
 
     async def ask_additional_question(self):
@@ -210,41 +425,31 @@ class Application:
                 color=discord.Color.orange()
             )
             view = ApplicationResponseView()
-            await self.channel.send(embed=embed, view=view)
+            prompt = await self.channel.send(embed=embed, view=view)
+            self.cleanup_message_ids.append(prompt.id)
             self.collecting_response = True
+            expiry.touch(self.channel.id)
         else:
             await self.save_additional_answers()
 
     async def add_additional_response(self, messages):
-        response_parts = []
-        files = []
-        for message in messages:
-            if message.content:
-                response_parts.append(message.content)
-            for attachment in message.attachments:
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(attachment.url) as resp:
-                        if resp.status == 200:
-                            data = io.BytesIO(await resp.read())
-                            data.seek(0)
-                            files.append({"filename": attachment.filename, "data": data})
-                file_link = f"[{attachment.filename}](файл будет приложен ниже)"
-                response_parts.append(file_link)
-            if message.attachments and any(att.content_type and att.content_type.startswith('audio/') for att in message.attachments):
-                response_parts.append("[Голосовое сообщение]")
-        full_response = "\n".join(response_parts)
+        full_response, files = await self.collect_response(messages)
         q_num = self.additional_questions[self.current_additional_index]
-        self.additional_answers[q_num] = {"text": full_response, "files": files, "messages": messages}
+        self.additional_answers[q_num] = Answer(full_response, files, [message.id for message in messages])
         self.current_additional_index += 1
         self.temp_messages = []
         self.collecting_response = False
-        await self.channel.purge(limit=None)
+        self.schedule_cleanup(messages, files)
+        state_store.mark_dirty(self)
         await self.ask_additional_question()
 
     async def save_additional_answers(self):
         for q_num, answer in self.additional_answers.items():
-            self.responses[q_num-1]['text'] += f"\n**Дополнение:**\n{answer['text']}"
-            self.responses[q_num-1]['files'].extend(answer['files'])
+            response = self.responses[q_num-1]
+            response.text += f"\n**Дополнение:**\n{answer.text}"
+            response.files.extend(answer.files)
+            response.message_ids.extend(answer.message_ids)
+        state_store.mark_dirty(self)
         await self.show_summary()
 
 class RejectReasonView(discord.ui.View):
@@ -326,22 +531,14 @@ class RejectDetailsCustomReasonModal(discord.ui.Modal, title="Отклонить
         details = self.details.value
         nickname = self.nickname.value
         action = "rejected" if self.set_role == "да" else "temporary_failure"
-        now = datetime.now()
-
-        async with mysql_pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                await cur.execute(
-                    "UPDATE whitelist SET action=%s, role_datetime=%s, nickname=%s WHERE channel_id=%s",
-                    (action, now, nickname, interaction.channel.id)
-                )
 
         embed = discord.Embed(
             title="Ваша заявка отклонена",
             description=f"Причина: Другое ({custom_reason_text})\n{details}\nНик: {nickname}",
             color=discord.Color.red()
         )
-        await interaction.channel.send(embed=embed)
-        await interaction.response.send_message("Заявка успешно отклонена!", ephemeral=True)
+        if await record_decision(interaction, action, nickname, embed):
+            await interaction.response.send_message("Заявка успешно отклонена!", ephemeral=True)
 
 class RejectDetailsModal(discord.ui.Modal, title="Отклонить заявку - подробная причина"):
     def __init__(self, reason, set_role):
@@ -364,20 +561,13 @@ class RejectDetailsModal(discord.ui.Modal, title="Отклонить заявк
         details = self.details.value
         nickname = self.nickname.value
         action = "rejected" if self.set_role == "да" else "temporary_failure"
-        now = datetime.now()
-        async with mysql_pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                await cur.execute(
-                    "UPDATE whitelist SET action=%s, role_datetime=%s, nickname=%s WHERE channel_id=%s",
-                    (action, now, nickname, interaction.channel.id)
-                )
         embed = discord.Embed(
             title="Ваша заявка отклонена",
             description=f"Причина: {self.reason}\n{details}\nНик: {nickname}",
             color=discord.Color.red()
         )
-        await interaction.channel.send(embed=embed)
-        await interaction.response.send_message("Заявка успешно отклонена!", ephemeral=True)
+        if await record_decision(interaction, action, nickname, embed):
+            await interaction.response.send_message("Заявка успешно отклонена!", ephemeral=True)
 
 class AcceptModal(discord.ui.Modal, title="Принять заявку"):
     nickname = discord.ui.TextInput(
@@ -387,464 +577,629 @@ class AcceptModal(discord.ui.Modal, title="Принять заявку"):
 
     async def on_submit(self, interaction: discord.Interaction):
         nickname = self.nickname.value
-        now = datetime.now()
-        async with mysql_pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                await cur.execute(
-                    "UPDATE whitelist SET action=%s, nickname=%s, role_datetime=%s WHERE username=%s",
-                    ("accept", nickname, now, str(interaction.user))
-                )
         embed = discord.Embed(
             title="Заявка принята",
             description=f"Ник: {nickname}",
             color=discord.Color.green()
         )
-        await interaction.channel.send(embed=embed)
-        try:
-            await interaction.user.send(
+        if not await record_decision(interaction, "accept", nickname, embed):
+            return
+        applicant = await applicant_member(interaction.channel)
+        if applicant:
+            run_in_background(send_direct_message(
+                applicant,
                 embed=discord.Embed(
                     title="Ваша заявка принята!",
                     description=f"Поздравляем! Ваш ник: {nickname}",
                     color=discord.Color.green()
                 )
+            ))
+        await interaction.response.send_message("Заявка успешно принята!", ephemeral=True)
+
+class CloseJob(Job):
+    # Этапы закрытия запоминаются, чтобы повтор после временной ошибки не
+    # отправлял в архив одно и то же дважды.
+    def __init__(self, channel, moderator, interaction, release_whitelist=False):
+        self.channel = channel
+        self.moderator = moderator
+        self.interaction = interaction
+        # Для заброшенных заявок строка whitelist удаляется, чтобы
+        # пользователь мог подать заявку заново
+        self.release_whitelist = release_whitelist
+        self.released = False
+        self.details = None
+        self.transcript = None
+        self.info_sent = False
+        self.archive_url = None
+        self.archived = False
+        self.stored = False
+
+    async def report(self, content):
+        # Токен взаимодействия живёт 15 минут, а после удаления канала
+        # сообщение уже не отредактировать
+        if self.interaction is None:
+            return
+        try:
+            await self.interaction.edit_original_response(content=content)
+        except discord.HTTPException:
+            pass
+
+    async def retrying(self, attempt, delay, error):
+        await self.report(f"Ошибка при закрытии заявки, повтор через {delay:.0f} с (попытка {attempt + 1}).")
+
+    async def failed(self, error):
+        await self.report(f"Не удалось закрыть заявку: {error}")
+
+    async def load_details(self):
+        channel = self.channel
+        application = await get_application(channel)
+        details = {
+            "application": application,
+            "user_id": None,
+            "username": "Неизвестно",
+            "nickname": "Неизвестно",
+            "number": None,
+        }
+        async with mysql_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT username, nickname, user_id, application_number FROM whitelist WHERE channel_id=%s", (channel.id,))
+                result = await cur.fetchone()
+        if application:
+            details["user_id"] = application.user.id
+            details["username"] = str(application.user)
+        elif result:
+            details["username"] = result[0]
+            details["user_id"] = result[2]
+        else:
+            return None
+        if result:
+            details["nickname"] = result[1] or details["nickname"]
+            details["number"] = result[3]
+        return details
+
+    async def render(self):
+        channel = self.channel
+        records = await ticket_log.read(channel.id)
+        async with metrics.TRANSCRIPT_RENDER.time():
+            if records is None:
+                # Заявки, открытые до появления журнала, собираются из истории канала
+                transcript = TranscriptWriter(channel.name)
+                async for message in channel.history(limit=None, oldest_first=True):
+                    transcript.add_message(message)
+                transcript_file = transcript.finish()
+            else:
+                transcript_file = await asyncio.get_running_loop().run_in_executor(None, render_transcript, channel.name, records)
+        return transcript_file.getvalue()
+
+    async def run(self):
+        channel = self.channel
+        details = self.details
+        if details is None:
+            await self.report("Собираю данные заявки...")
+            details = self.details = await self.load_details()
+            if details is None:
+                await self.report("Не удалось найти информацию о заявке в памяти или БД.")
+                return False
+        applicant_id = details["user_id"] or "Неизвестно"
+
+        if self.transcript is None:
+            await self.report("Формирую транскрипт...")
+            self.transcript = await self.render()
+
+        archive_channel = bot.get_channel(ARCHIVE_CHANNEL_ID)
+        if archive_channel and not self.archived:
+            await self.report("Отправляю в архив...")
+            if not self.info_sent:
+                info_message = (
+                    f"**Заявка закрыта:** {channel.name}\n"
+                    f"Ник игрока: {details['nickname']}\n"
+                    f"Пользователь дискорда: {details['username']}\n"
+                    f"ID пользователя дискорда: {applicant_id}\n"
+                    f"Кто закрыл заявку: {self.moderator}"
+                )
+                await rest_scheduler.submit(BACKGROUND, archive_channel.send, info_message)
+                self.info_sent = True
+            archive_message = await rest_scheduler.submit(
+                BACKGROUND,
+                archive_channel.send,
+                file=discord.File(io.BytesIO(self.transcript), filename=f"{channel.name}.html")
             )
-        except Exception:
+            self.archive_url = archive_message.jump_url
+            self.archived = True
+
+        if not self.stored:
+            application = details["application"]
+            try:
+                await application_archive.store(
+                    details["number"],
+                    channel,
+                    details["user_id"],
+                    details["username"],
+                    details["nickname"],
+                    str(self.moderator),
+                    answers_text(QUESTIONS, application.responses) if application else "",
+                    self.transcript,
+                    self.archive_url
+                )
+            except TRANSIENT_ERRORS:
+                raise
+            except Exception as e:
+                # Без строки архива заявку не найти поиском, поэтому канал и
+                # журнал не удаляются
+                log.exception("Error storing application in archive", extra={"channel_id": channel.id, "user_id": applicant_id})
+                await self.report(f"Не удалось сохранить заявку в архив: {e}. Канал не удалён, закройте заявку ещё раз.")
+                return False
+            self.stored = True
+
+        if self.release_whitelist and not self.released:
+            async with mysql_pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute("DELETE FROM whitelist WHERE channel_id=%s AND action=%s", (channel.id, 'none'))
+            self.released = True
+
+        await self.report("Удаляю канал...")
+        closed_application = active_applications.remove(channel.id)
+        expiry.cancel(channel.id)
+        if closed_application:
+            # Дожидаемся обработки ответа, если она идёт, и запрещаем новые
+            async with closed_application.lock:
+                closed_application.closed = True
+                closed_application.release_files()
+        state_store.delete(channel.id)
+        await ticket_log.delete(channel.id)
+
+        try:
+            await channel.delete()
+        except discord.NotFound:
             pass
-        await interaction.response.send_message("Заявка успешно принята!", ephemeral=True)
+        log.info("Application closed", extra={"channel_id": channel.id, "user_id": applicant_id})
+
+        await self.report("Заявка закрыта и заархивирована!")
 
 mysql_pool = None
 mysql_lp_pool = None
-
-async def init_mysql():
-    global mysql_pool
-    mysql_pool = await aiomysql.create_pool(
+sync_queue = None
+state_store = None
+application_archive = None
+rest_scheduler = RestScheduler(concurrency=REST_BACKGROUND_CONCURRENCY, normal_concurrency=REST_NORMAL_CONCURRENCY)
+close_jobs = JobQueue('close', concurrency=CLOSE_CONCURRENCY, max_attempts=CLOSE_MAX_ATTEMPTS, retry_delay=CLOSE_RETRY_DELAY)
+downloader = AttachmentDownloader(max_concurrency=DOWNLOAD_CONCURRENCY, max_file_size=MAX_ATTACHMENT_SIZE)
+attachment_cache = AttachmentCache(ATTACHMENT_CACHE_DIR, ATTACHMENT_CACHE_SIZE)
+ticket_log = TicketLog(TRANSCRIPT_LOG_DIR, flush_interval=TRANSCRIPT_LOG_FLUSH_INTERVAL)
+
+async def create_mysql_pool(db, name):
+    pool = await aiomysql.create_pool(
         host=os.getenv('MYSQL_HOST'),
         port=int(os.getenv('MYSQL_PORT')),
         user=os.getenv('MYSQL_USER'),
         password=os.getenv('MYSQL_PASSWORD'),
-        db=os.getenv('MYSQL_DB'),
-        autocommit=True
+        db=db,
+        autocommit=True,
+        minsize=MYSQL_POOL_MIN_SIZE,
+        maxsize=MYSQL_POOL_MAX_SIZE
+    )
+    return metrics.InstrumentedPool(pool, name)
+
+async def warm_up_pool(pool, connections):
+    async def ping():
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT 1")
+    await asyncio.gather(*(ping() for _ in range(connections)))
+
+async def init_mysql():
+    global mysql_pool, mysql_lp_pool, state_store, application_archive
+    mysql_pool, mysql_lp_pool = await asyncio.gather(
+        create_mysql_pool(os.getenv('MYSQL_DB'), 'main'),
+        create_mysql_pool(MYSQL_LP_DB, 'luckperms')
+    )
+    await asyncio.gather(
+        migrate(mysql_pool),
+        warm_up_pool(mysql_lp_pool, MYSQL_POOL_MIN_SIZE)
     )
+    log.info("MySQL pools ready")
+    state_store = ApplicationStateStore(mysql_pool, flush_interval=APPLICATION_STATE_FLUSH_INTERVAL)
+    application_archive = ApplicationArchive(mysql_pool)
+
+async def close_mysql():
+    for pool in (mysql_pool, mysql_lp_pool):
+        if pool is not None:
+            pool.close()
+            await pool.wait_closed()
+
+async def restore_attachment_cache():
+    # Вложения открытых заявок остаются на диске, чтобы сводка после
+    # перезапуска загрузила их, а не ссылалась на сообщения заявителя
+    keys = set()
+    for state in await state_store.load_all():
+        answers = state["responses"] + list((state.get("additional_answers") or {}).values())
+        keys.update(file["key"] for answer in answers for file in answer["files"] if file.get("key"))
+    await asyncio.get_running_loop().run_in_executor(None, attachment_cache.restore, keys)
+    log.info("Attachment cache restored: %d file(s)", len(attachment_cache))
+
+metrics_runner = None
+
+async def start_metrics_server():
+    global metrics_runner
+    if metrics_runner or not METRICS_PORT:
+        return
+    metrics.REST_QUEUE_DEPTH.set_function(lambda: rest_scheduler.depth()[NORMAL], priority="normal")
+    metrics.REST_QUEUE_DEPTH.set_function(lambda: rest_scheduler.depth()[BACKGROUND], priority="background")
+    metrics.REST_IN_FLIGHT.set_function(lambda: rest_scheduler.in_flight[NORMAL], priority="normal")
+    metrics.REST_IN_FLIGHT.set_function(lambda: rest_scheduler.in_flight[BACKGROUND], priority="background")
+    metrics.JOB_QUEUE_DEPTH.set_function(close_jobs.depth, queue="close")
+    metrics.OPEN_APPLICATIONS.set_function(lambda: len(active_applications))
+    try:
+        metrics_runner = await metrics.start_server(METRICS_HOST, METRICS_PORT)
+        log.info("Metrics available at http://%s:%d/metrics", METRICS_HOST, METRICS_PORT)
+    except OSError:
+        log.exception("Error starting metrics server")
+
+async def allocate_application(user, channel_id):
+    # Счётчик увеличивается через LAST_INSERT_ID, поэтому номер читается из
+    # ответа на UPDATE без отдельного SELECT. Блокировка строки счётчика и
+    # уникальный username делают выдачу номера и вставку одной транзакцией.
     async with mysql_pool.acquire() as conn:
         async with conn.cursor() as cur:
-            await cur.execute("""
-                CREATE TABLE IF NOT EXISTS whitelist (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    username VARCHAR(100) UNIQUE,
-                    action VARCHAR(32) DEFAULT 'none',
-                    create_datetime DATETIME,
-                    role_datetime DATETIME,
-                    nickname VARCHAR(100),
-                    channel_id BIGINT,
-                    `join` INT DEFAULT 0,
-                    application_number INT DEFAULT 0
+            await conn.begin()
+            try:
+                await cur.execute(
+                    "INSERT INTO application_counter (id, last_number) VALUES (1, LAST_INSERT_ID(1)) "
+                    "ON DUPLICATE KEY UPDATE last_number = LAST_INSERT_ID(last_number + 1)"
                 )
-            """)
-            print("MySQL whitelist table checked/created successfully!")
-
-            await cur.execute(
-                """CREATE TABLE IF NOT EXISTS application_counter (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    last_number INT DEFAULT 0
+                application_number = cur.lastrowid
+                await cur.execute(
+                    "INSERT INTO whitelist (username, user_id, action, create_datetime, channel_id, application_number) VALUES (%s, %s, %s, %s, %s, %s)",
+                    (str(user), user.id, 'none', datetime.now(), channel_id, application_number)
                 )
-                """
+                whitelist_id = cur.lastrowid
+                await conn.commit()
+            except aiomysql.IntegrityError:
+                await conn.rollback()
+                await cur.execute("SELECT action FROM whitelist WHERE username=%s", (str(user),))
+                result = await cur.fetchone()
+                return None, None, result[0] if result else 'none'
+            except Exception:
+                await conn.rollback()
+                raise
+    return application_number, whitelist_id, None
+
+async def release_allocation(whitelist_id, channel=None):
+    if channel is not None:
+        try:
+            await channel.delete()
+        except discord.HTTPException:
+            log.warning("Error deleting channel of failed application", extra={"channel_id": channel.id})
+    try:
+        async with mysql_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("DELETE FROM whitelist WHERE id=%s AND action=%s", (whitelist_id, 'none'))
+    except Exception:
+        log.exception("Error releasing whitelist row %s of failed application", whitelist_id)
+
+async def command_tree_hash():
+    payload = [command.to_dict(bot.tree) for command in bot.tree.get_commands()]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+async def sync_command_tree():
+    # Синхронизация дорогая и ограничена Discord, поэтому выполняется только
+    # если набор команд изменился с прошлого запуска.
+    tree_hash = await command_tree_hash()
+    async with mysql_pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT value FROM bot_state WHERE name=%s", ('command_tree_hash',))
+            result = await cur.fetchone()
+    if result and result[0] == tree_hash:
+        log.info("Command tree unchanged, skipping sync")
+        return
+    synced = await bot.tree.sync()
+    log.info("Synced %d command(s)", len(synced))
+    async with mysql_pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                "INSERT INTO bot_state (name, value) VALUES (%s, %s) ON DUPLICATE KEY UPDATE value=VALUES(value)",
+                ('command_tree_hash', tree_hash)
             )
-            print("MySQL application_counter table checked/created successfully!")
 
-            await cur.execute("SELECT COUNT(*) FROM application_counter")
-            count = await cur.fetchone()
-            if count[0] == 0:
-                await cur.execute("INSERT INTO application_counter (last_number) VALUES (0)")
-                await conn.commit()
-                print("Application counter initialized.")
+@bot.event
+async def on_ready():
+    log.info("%s has connected to Discord!", bot.user)
+    register_dormant_applications()
 
-async def init_mysql_lp():
-    global mysql_lp_pool
-    mysql_lp_pool = await aiomysql.create_pool(
-        host=os.getenv('MYSQL_HOST'),
-        port=int(os.getenv('MYSQL_PORT')),
-        user=os.getenv('MYSQL_USER'),
-        password=os.getenv('MYSQL_PASSWORD'),
-        db=MYSQL_LP_DB,
-        autocommit=True
-    )
+@bot.event
+async def on_guild_role_create(role):
+    admin_roles.invalidate(role.guild)
 
 @bot.event
-async def on_ready():
-    print(f'{bot.user} has connected to Discord!')
-    await init_mysql()
-    await init_mysql_lp()
-    bot.loop.create_task(check_accepted_users())
-    bot.loop.create_task(check_rejected_users())
-    try:
-        synced = await bot.tree.sync()
-        print(f"Synced {len(synced)} command(s)")
-    except Exception as e:
-        print(e)
+async def on_guild_role_update(before, after):
+    admin_roles.invalidate(after.guild)
+
+@bot.event
+async def on_guild_role_delete(role):
+    admin_roles.invalidate(role.guild)
 
 @bot.event
 async def on_message(message):
+    if message.channel.id not in active_applications:
+        return
+
+    # В журнал попадают и сообщения бота, поэтому проверка автора идёт после
+    ticket_log.append(message.channel.id, message_record(message))
     if message.author.bot:
         return
 
-    if message.channel.name.startswith("заявка-"):
-        application = next((app for app in active_applications if app.channel == message.channel), None)
-        if application and application.collecting_response:
-            application.temp_messages.append(message)
+    application = await get_application(message.channel)
+    if application and application.collecting_response:
+        application.temp_messages.append(PendingMessage.from_message(message))
+        expiry.touch(message.channel.id)
+
+ROUTED_CUSTOM_IDS = frozenset({"create_application", "send_response", "request_more", "accept", "reject", "close_application"})
+recent_interactions = InteractionDeduplicator()
+
+def interaction_key(interaction, custom_id):
+    if custom_id not in ROUTED_CUSTOM_IDS or interaction.message is None:
+        return None
+    # Нажатие другого пользователя (модератора после заявителя) не повтор
+    return interaction.message.id, custom_id, interaction.user.id
 
 @bot.event
 async def on_interaction(interaction: discord.Interaction):
-    if interaction.type == discord.InteractionType.component:
-        custom_id = interaction.data.get('custom_id')
-        if custom_id == "create_application":
-            await interaction.response.send_message("Создаю заявку...", ephemeral=True)
-            
+    if interaction.type != discord.InteractionType.component:
+        return
+    custom_id = interaction.data.get('custom_id')
+    key = interaction_key(interaction, custom_id)
+    if key is not None and not recent_interactions.begin(key):
+        metrics.DUPLICATE_INTERACTIONS.inc(custom_id=custom_id)
+        await interaction.response.defer()
+        return
+    start = time.perf_counter()
+    try:
+        await handle_component(interaction, custom_id)
+    finally:
+        if key is not None:
+            recent_interactions.end(key)
+        label = custom_id if custom_id in ROUTED_CUSTOM_IDS else "other"
+        metrics.INTERACTION_LATENCY.observe(time.perf_counter() - start, custom_id=label)
+
+async def handle_component(interaction: discord.Interaction, custom_id):
+    if custom_id == "create_application":
+        await interaction.response.send_message("Создаю заявку...", ephemeral=True)
+        
+        if active_applications.get_by_user(interaction.user.id):
+            await interaction.followup.send("У вас уже есть активная заявка!", ephemeral=True)
+            return
+
+        category = bot.get_channel(CATEGORY_ID)
+        
+        if not category:
+            log.error("Category with ID %s not found", CATEGORY_ID, extra={"user_id": interaction.user.id})
+            await interaction.followup.send("Произошла ошибка при создании заявки: категория не найдена.", ephemeral=True)
+            return
+
+        new_application_number, whitelist_id, existing_action = await allocate_application(interaction.user, interaction.channel.id)
+        if existing_action == 'none':
+            await interaction.followup.send("У вас уже есть активная заявка!", ephemeral=True)
+            return
+        if existing_action:
+            await interaction.followup.send("Вы уже подавали заявку.", ephemeral=True)
+            return
+
+        channel_name = f"заявка-{new_application_number:04d}"
+        overwrites = {
+            interaction.guild.default_role: discord.PermissionOverwrite(read_messages=False),
+            interaction.user: discord.PermissionOverwrite(read_messages=True, send_messages=True),
+            interaction.guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True)
+        }
+        for role in admin_roles.roles(interaction.guild):
+            overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+        channel = None
+        try:
+            channel = await category.create_text_channel(channel_name, overwrites=overwrites)
+
+            # Модальные окна и синхронизация LuckPerms ищут строку по каналу заявки
             async with mysql_pool.acquire() as conn:
                 async with conn.cursor() as cur:
-                    await cur.execute("SELECT id FROM whitelist WHERE username=%s AND action=%s", (str(interaction.user), 'none'))
-                    exists = await cur.fetchone()
-                    if exists:
-                        await interaction.followup.send("У вас уже есть активная заявка!", ephemeral=True)
-                        return
-                    
-                    await cur.execute("SELECT last_number FROM application_counter WHERE id=1")
-                    result = await cur.fetchone()
-                    current_application_number = result[0] if result else 0
-                    
-                    new_application_number = current_application_number + 1
-                    
-                    if result:
-                        await cur.execute("UPDATE application_counter SET last_number=%s WHERE id=1", (new_application_number,))
-                    else:
-                        await cur.execute("INSERT INTO application_counter (id, last_number) VALUES (1, %s)", (new_application_number,))
-                    
-                    await cur.execute(
-                        "INSERT INTO whitelist (username, action, create_datetime, channel_id, application_number) VALUES (%s, %s, %s, %s, %s)",
-                        (str(interaction.user), 'none', datetime.now(), interaction.channel.id, new_application_number)
-                    )
-            
-            channel_name = f"заявка-{new_application_number:04d}"
-            category = bot.get_channel(CATEGORY_ID)
-            
-            if not category:
-                print(f"Error: Category with ID {CATEGORY_ID} not found.")
-                await interaction.followup.send("Произошла ошибка при создании заявки: категория не найдена.", ephemeral=True)
-                return
-
-            channel = await category.create_text_channel(
-                channel_name,
-                overwrites={
-                    interaction.guild.default_role: discord.PermissionOverwrite(read_messages=False),
-                    interaction.user: discord.PermissionOverwrite(read_messages=True, send_messages=True),
-                    interaction.guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True)
-                }
-            )
-            for role_name in ADMIN_ROLES:
-                role = discord.utils.get(interaction.guild.roles, name=role_name)
-                if role:
-                    await channel.set_permissions(role, read_messages=True, send_messages=True)
-            
-            application = Application(interaction.user, channel)
-            active_applications.append(application)
-            
-            await application.start()
-            
-            await interaction.followup.send(f"Заявка #{new_application_number} создана в канале {channel.mention}", ephemeral=True)
-
-        elif custom_id == "send_response":
-            application = next((app for app in active_applications if app.channel == interaction.channel), None)
-            if not application or not application.collecting_response:
-                await interaction.response.send_message("Ошибка: заявка не найдена или не ожидает ответа", ephemeral=True)
-                return
-            if not application.temp_messages:
-                await interaction.response.send_message("Пожалуйста, отправьте хотя бы одно сообщение перед нажатием кнопки 'Отправить'", ephemeral=True)
-                return
+                    await cur.execute("UPDATE whitelist SET channel_id=%s WHERE id=%s", (channel.id, whitelist_id))
+        except Exception:
+            # Например, в категории уже 50 каналов. Без отката строка 'none'
+            # навсегда запретила бы пользователю новую заявку.
+            log.exception("Error creating application channel", extra={"ticket": new_application_number, "user_id": interaction.user.id})
+            await release_allocation(whitelist_id, channel)
+            await interaction.followup.send("Произошла ошибка при создании заявки: не удалось создать канал. Попробуйте позже.", ephemeral=True)
+            return
+        
+        application = Application(interaction.user, channel)
+        ticket_log.open(channel.id)
+        active_applications.add(application)
+        log.info("Application created", extra={"ticket": new_application_number, "channel_id": channel.id, "user_id": interaction.user.id})
+        
+        await application.start()
+        
+        await interaction.followup.send(f"Заявка #{new_application_number} создана в канале {channel.mention}", ephemeral=True)
+
+    elif custom_id == "send_response":
+        application = await get_application(interaction.channel)
+        if application and application.lock.locked():
+            # Ответ уже обрабатывается — повторное нажатие ничего не делает
             await interaction.response.defer()
-            try:
+            return
+        if not application or application.closed or not application.collecting_response:
+            await interaction.response.send_message("Ошибка: заявка не найдена или не ожидает ответа", ephemeral=True)
+            return
+        if not application.temp_messages:
+            await interaction.response.send_message("Пожалуйста, отправьте хотя бы одно сообщение перед нажатием кнопки 'Отправить'", ephemeral=True)
+            return
+        await interaction.response.defer()
+        try:
+            async with application.lock:
+                if application.closed or not application.collecting_response or not application.temp_messages:
+                    return
                 if hasattr(application, 'additional_questions') and application.additional_questions and getattr(application, 'current_additional_index', 0) < len(application.additional_questions):
                     await application.add_additional_response(application.temp_messages)
                 else:
                     await application.add_response(application.temp_messages)
-            except Exception as e:
-                await interaction.followup.send(f"Произошла ошибка при обработке ответа: {str(e)}", ephemeral=True)
-
-        elif custom_id == "request_more":
-            has_permission = False
-            for role in interaction.user.roles:
-                if role.name in ADMIN_ROLES:
-                    has_permission = True
-                    break
-            if not has_permission:
-                await interaction.response.send_message("У вас нет прав для выполнения этого действия!", ephemeral=True)
-                return
-            modal = RequestMoreModal()
-            await interaction.response.send_modal(modal)
-
-        elif custom_id == "accept":
-            has_permission = False
-            for role in interaction.user.roles:
-                if role.name in ADMIN_ROLES:
-                    has_permission = True
-                    break
-            if not has_permission:
-                await interaction.response.send_message("У вас нет прав для выполнения этого действия!", ephemeral=True)
-                return
-            modal = AcceptModal()
-            await interaction.response.send_modal(modal)
-        elif custom_id == "reject":
-            has_permission = False
-            for role in interaction.user.roles:
-                if role.name in ADMIN_ROLES:
-                    has_permission = True
-                    break
-            if not has_permission:
-                await interaction.response.send_message("У вас нет прав для выполнения этого действия!", ephemeral=True)
-                return
-            view = RejectReasonView()
-            await interaction.response.send_message("Выберите причину отказа и вариант роли:", view=view, ephemeral=True)
-        elif custom_id == "close_application":
-            has_permission = False
-            for role in interaction.user.roles:
-                if role.name in ADMIN_ROLES:
-                    has_permission = True
-                    break
-            if not has_permission:
-                await interaction.response.send_message("У вас нет прав для выполнения этого действия!", ephemeral=True)
-                return
-
-            await interaction.response.defer()
-            channel = interaction.channel
-            
-            application = next((app for app in active_applications if app.channel == channel), None)
-
-            if application:
-                applicant_user = application.user
-                applicant_username_str = str(applicant_user)
-                applicant_id = applicant_user.id
-                nickname_from_db = "Неизвестно"
-                async with mysql_pool.acquire() as conn:
-                    async with conn.cursor() as cur:
-                        await cur.execute("SELECT nickname FROM whitelist WHERE username=%s", (applicant_username_str,))
-                        result = await cur.fetchone()
-                        if result:
-                            nickname_from_db = result[0]
-
-            else:
-                applicant_user = None
-                nickname_from_db = "Неизвестно"
-                applicant_username_str = "Неизвестно"
-                applicant_id = "Неизвестно"
-                async with mysql_pool.acquire() as conn:
-                    async with conn.cursor() as cur:
-                        await cur.execute("SELECT username, nickname FROM whitelist WHERE channel_id=%s", (channel.id,))
-                        result = await cur.fetchone()
-                        if result:
-                            applicant_username_str = result[0]
-                            nickname_from_db = result[1]
-                            try:
-                                applicant_user = await bot.fetch_user(int(applicant_username_str.split('#')[-1]) if '#' in applicant_username_str else int(applicant_username_str))
-                                applicant_id = applicant_user.id
-                            except:
-                                pass
-
-                if applicant_user is None and applicant_username_str == "Неизвестно":
-                    await interaction.followup.send("Не удалось найти информацию о заявке в памяти или БД.", ephemeral=True)
-                    return
-
-            closer_username_str = str(interaction.user)
-
-            html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-<title>Чат заявки: {channel.name}</title>
-<style>
-body {{ font-family: sans-serif; background-color: #36393f; color: #dcddde; }}
-.message {{ display: flex; margin-bottom: 10px; padding: 5px; background-color: #303338; border-radius: 5px; }}
-.avatar {{ width: 40px; height: 40px; border-radius: 50%; margin-right: 10px; }}\n.message-content {{ flex-grow: 1; }}\n.author {{ font-weight: bold; color: #ffffff; }}\n.timestamp {{ font-size: 0.8em; color: #72767d; margin-left: 10px; }}\n.content {{ margin-top: 5px; white-space: pre-wrap; }}\n.embed {{ border-left: 4px solid #7289da; padding: 10px; margin-top: 10px; background-color: #2c2f33; }}\n.embed-title {{ font-weight: bold; color: #ffffff; margin-bottom: 5px; }}\n.embed-description {{ font-size: 0.9em; color: #dcddde; margin-bottom: 5px; }}\n.embed-field {{ margin-bottom: 5px; }}\n.embed-field-name {{ font-weight: bold; color: #ffffff; }}\n.embed-field-value {{ font-size: 0.9em; color: #dcddde; }}\n.attachment {{ display: block; margin-top: 5px; color: #00b0f4; text-decoration: none; }}\n</style>
-</head>
-<body>
-<h1>Чат заявки: {channel.name}</h1>
-"""
-
-            async for message in channel.history(limit=None, oldest_first=True):
-                html_content += "<div class='message'>"
-                if message.author:
-                    avatar_url = message.author.avatar.url if message.author.avatar else message.author.default_avatar.url
-                    author_display_name = message.author.display_name
-                else:
-                    avatar_url = ""
-                    author_display_name = "Неизвестный пользователь"
-
-                html_content += f"<img class='avatar' src='{avatar_url}' alt='{author_display_name}'>"
-                html_content += "<div class='message-content'>"
-                html_content += f"<span class='author'>{author_display_name}</span><span class='timestamp'>{message.created_at.strftime('%Y-%m-%d %H:%M:%S')}</span>"
-
-                if message.content:
-                    processed_content = re.sub(emoji_pattern, replace_emoji, message.content)
-                    html_content += f"<p class='content'>{processed_content}</p>"
-
-                for embed in message.embeds:
-                    html_content += "<div class='embed'>"
-                    if embed.title:
-                        processed_title = re.sub(emoji_pattern, replace_emoji, embed.title)
-                        html_content += f"<div class='embed-title'>{processed_title}</div>"
-                    if embed.description:
-                        processed_description = re.sub(emoji_pattern, replace_emoji, embed.description)
-                        html_content += f"<div class='embed-description'>{processed_description}</div>"
-                    for field in embed.fields:
-                        html_content += "<div class='embed-field'>"
-                        processed_field_name = re.sub(emoji_pattern, replace_emoji, field.name)
-                        processed_field_value = re.sub(emoji_pattern, replace_emoji, field.value)
-                        html_content += f"<div class='embed-field-name'>{processed_field_name}</div>"
-                        html_content += f"<div class='embed-field-value'>{processed_field_value}</div>"
-                        html_content += "</div>"
-                    html_content += "</div>"
-
-                for attachment in message.attachments:
-                    html_content += f"<a href='{attachment.url}' class='attachment'>{attachment.filename}</a>"
-
-                html_content += "</div></div>"
-
-            html_content += """
-</body>
-</html>
-"""
-
-            filename = f"{channel.name}.html"
-            with open(filename, "w", encoding="utf-8") as f:
-                f.write(html_content)
-
-            archive_channel = bot.get_channel(ARCHIVE_CHANNEL_ID)
-            if archive_channel:
-                info_message = (
-                    f"**Заявка закрыта:** {channel.name}\n"
-                    f"Ник игрока: {nickname_from_db}\n"
-                    f"Пользователь дискорда: {applicant_username_str}\n"
-                    f"ID пользователя дискорда: {applicant_id}\n"
-                    f"Кто закрыл заявку: {closer_username_str}"
-                )
-                await archive_channel.send(info_message)
-                
-                with open(filename, "rb") as f:
-                    await archive_channel.send(file=discord.File(f, filename=filename))
-
-            os.remove(filename)
-
-            active_applications[:] = [app for app in active_applications if app.channel != channel]
+        except Exception as e:
+            log.exception("Error processing response", extra={"channel_id": interaction.channel.id, "user_id": interaction.user.id})
+            await interaction.followup.send(f"Произошла ошибка при обработке ответа: {str(e)}", ephemeral=True)
 
-            await channel.delete()
+    elif custom_id == "request_more":
+        if not await admin_roles.check(interaction):
+            return
+        modal = RequestMoreModal()
+        await interaction.response.send_modal(modal)
 
-            await interaction.followup.send("Заявка закрыта и заархивирована!", ephemeral=True)
+    elif custom_id == "accept":
+        if not await admin_roles.check(interaction):
+            return
+        modal = AcceptModal()
+        await interaction.response.send_modal(modal)
+    elif custom_id == "reject":
+        if not await admin_roles.check(interaction):
+            return
+        view = RejectReasonView()
+        await interaction.response.send_message("Выберите причину отказа и вариант роли:", view=view, ephemeral=True)
+    elif custom_id == "close_application":
+        if not await admin_roles.check(interaction):
+            return
 
-async def check_accepted_users():
-    await bot.wait_until_ready()
-    while not bot.is_closed():
-        await asyncio.sleep(10)
-        try:
-            async with mysql_pool.acquire() as conn:
-                async with conn.cursor() as cur:
-                    await cur.execute("SELECT username, nickname FROM whitelist WHERE action=%s AND `join`=%s", ('accept', 0))
-                    users_to_process = await cur.fetchall()
-
-            for user_data in users_to_process:
-                username = user_data[0]
-                nickname = user_data[1].lower()
-
-                if not nickname or nickname == "неизвестно":
-                    print(f"Skipping user {username}: nickname not specified or is 'неизвестно'")
-                    continue
-
-                lp_inserted = False
-                async with mysql_lp_pool.acquire() as lp_conn:
-                    async with lp_conn.cursor() as lp_cur:
-                        await lp_cur.execute("SELECT uuid FROM luckperms_players WHERE username=%s", (nickname,))
-                        lp_user = await lp_cur.fetchone()
-
-                        if lp_user:
-                            user_uuid = lp_user[0]
-                            permission_value = f"group.{ACCEPT_ROLE}"
-                            try:
-                                await lp_cur.execute(
-                                    "INSERT INTO luckperms_user_permissions (uuid, permission, value, server, world, expiry, contexts) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-                                    (user_uuid, permission_value, 1, 'global', 'global', 0, '{}')
-                                )
-                                lp_inserted = True
-                                print(f"Inserted permission '{permission_value}' for user {username} (UUID: {user_uuid})")
-                            except aiomysql.IntegrityError:
-                                lp_inserted = True
-                                print(f"Permission '{permission_value}' already exists for user {username} (UUID: {user_uuid})")
-                            except Exception as e:
-                                print(f"Error inserting permission for user {username} (UUID: {user_uuid}): {e}")
-                        else:
-                             print(f"User {nickname} not found in LuckyPerms DB.")
-
-                if lp_inserted:
-                    async with mysql_pool.acquire() as conn:
-                        async with conn.cursor() as cur:
-                            await cur.execute("UPDATE whitelist SET `join`=%s WHERE username=%s", (1, username))
-                            print(f"Updated join status for user {username}")
+        ahead = close_jobs.submit(interaction.channel.id, CloseJob(interaction.channel, interaction.user, interaction))
+        if ahead is None:
+            await interaction.response.send_message("Заявка уже закрывается.", ephemeral=True)
+            return
+        await interaction.response.send_message(
+            f"Заявка поставлена в очередь на закрытие (впереди: {ahead})." if ahead else "Закрываю заявку...",
+            ephemeral=True
+        )
 
-        except Exception as e:
-            print(f"Error in check_accepted_users: {e}")
+active_applications = ApplicationRegistry()
+loading_applications = {}
+background_tasks = set()
 
-async def check_rejected_users():
-    await bot.wait_until_ready()
-    while not bot.is_closed():
-        await asyncio.sleep(10)
-        try:
-            async with mysql_pool.acquire() as conn:
-                async with conn.cursor() as cur:
-                    await cur.execute("SELECT username, nickname FROM whitelist WHERE action=%s AND `join`=%s", ('rejected', 0))
-                    users_to_process = await cur.fetchall()
-
-            for user_data in users_to_process:
-                username = user_data[0]
-                nickname = user_data[1].lower()
-
-                if not nickname or nickname == "неизвестно":
-                    print(f"Skipping rejected user {username}: nickname not specified or is 'неизвестно'")
-                    continue
-
-                lp_inserted = False
-                async with mysql_lp_pool.acquire() as lp_conn:
-                    async with lp_conn.cursor() as lp_cur:
-                        await lp_cur.execute("SELECT uuid FROM luckperms_players WHERE username=%s", (nickname,))
-                        lp_user = await lp_cur.fetchone()
-
-                        if lp_user:
-                            user_uuid = lp_user[0]
-                            permission_value = f"group.{REJECT_ROLE}"
-                            try:
-                                await lp_cur.execute(
-                                    "INSERT INTO luckperms_user_permissions (uuid, permission, value, server, world, expiry, contexts) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-                                    (user_uuid, permission_value, 1, 'global', 'global', 0, '{}')
-                                )
-                                lp_inserted = True
-                                print(f"Inserted rejected permission '{permission_value}' for user {username} (UUID: {user_uuid})")
-                            except aiomysql.IntegrityError:
-                                lp_inserted = True
-                                print(f"Rejected permission '{permission_value}' already exists for user {username} (UUID: {user_uuid})")
-                            except Exception as e:
-                                print(f"Error inserting rejected permission for user {username} (UUID: {user_uuid}): {e}")
-                        else:
-                             print(f"Rejected user {nickname} not found in LuckyPerms DB.")
-
-                if lp_inserted:
-                    async with mysql_pool.acquire() as conn:
-                        async with conn.cursor() as cur:
-                            await cur.execute("UPDATE whitelist SET `join`=%s WHERE username=%s", (1, username))
-                            print(f"Updated join status for rejected user {username}")
+async def send_direct_message(user, **kwargs):
+    try:
+        await rest_scheduler.submit(BACKGROUND, user.send, **kwargs)
+    except discord.HTTPException:
+        pass
+
+async def applicant_member(channel):
+    application = await get_application(channel)
+    if application:
+        return application.user
+    async with mysql_pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("SELECT user_id FROM whitelist WHERE channel_id=%s", (channel.id,))
+            result = await cur.fetchone()
+    return channel.guild.get_member(result[0]) if result and result[0] else None
+
+async def record_decision(interaction, action, nickname, embed):
+    # Повторная отправка того же решения (двойной клик, два модератора)
+    # не пишет в БД и не дублирует сообщения. False — ответ уже отправлен.
+    application = await get_application(interaction.channel)
+    lock = application.lock if application else asyncio.Lock()
+    async with lock:
+        if application and application.decision == (action, nickname):
+            await interaction.response.send_message("Это решение по заявке уже принято.", ephemeral=True)
+            return False
+        async with mysql_pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    "UPDATE whitelist SET action=%s, nickname=%s, role_datetime=%s WHERE channel_id=%s",
+                    (action, nickname, datetime.now(), interaction.channel.id)
+                )
+        sync_queue.push(action, interaction.channel.id)
+        if application:
+            application.decision = (action, nickname)
+        await interaction.channel.send(embed=embed)
+    return True
+
+def run_in_background(coro):
+    task = asyncio.ensure_future(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def rehydrate_application(channel):
+    # None — сохранённого состояния нет. Ошибки MySQL и Discord
+    # пробрасываются, чтобы временный сбой не считался отсутствием заявки.
+    loaded = await state_store.load(channel.id)
+    if not loaded:
+        return None
+    user_id, state = loaded
+    user = channel.guild.get_member(user_id) or await bot.fetch_user(user_id)
+    return Application.from_state(user, channel, state)
+
+async def get_application(channel):
+    application = active_applications.get(channel.id)
+    if application or not active_applications.is_dormant(channel.id):
+        return application
+    # Заявки, открытые до перезапуска, загружаются при первом обращении
+    task = loading_applications.get(channel.id)
+    if task is None:
+        task = asyncio.ensure_future(rehydrate_application(channel))
+        loading_applications[channel.id] = task
+    try:
+        application = await task
+    except Exception:
+        # Канал остаётся в реестре, загрузка повторится при следующем обращении
+        log.exception("Error loading application state", extra={"channel_id": channel.id})
+        return None
+    finally:
+        loading_applications.pop(channel.id, None)
+    if application:
+        if active_applications.get(channel.id) is None:
+            active_applications.add(application)
+        return active_applications.get(channel.id)
+    active_applications.remove(channel.id)
+    return None
+
+def register_dormant_applications():
+    category = bot.get_channel(CATEGORY_ID)
+    if not category:
+        return
+    for channel in category.text_channels:
+        if channel.name.startswith("заявка-"):
+            active_applications.add_dormant(channel.id)
+            # Состояние проверяется при срабатывании таймера
+            if active_applications.is_dormant(channel.id) and channel.id not in expiry:
+                expiry.touch(channel.id)
+
+async def inactive_application(channel_id):
+    channel = bot.get_channel(channel_id)
+    if channel is None:
+        return None
+    application = await get_application(channel)
+    if application is None or not application.collecting_response:
+        return None
+    return application
+
+async def remind_inactive(channel_id):
+    application = await inactive_application(channel_id)
+    if application is None:
+        expiry.cancel(channel_id)
+        return
+    await rest_scheduler.submit(
+        BACKGROUND,
+        application.channel.send,
+        f"{application.user.mention}, вы давно не отвечали на вопросы анкеты. "
+        f"Если ответа не будет, заявка закроется автоматически через {INACTIVITY_CLOSE_TIMEOUT / 3600:g} ч."
+    )
+    log.info("Inactivity reminder sent", extra={"channel_id": channel_id, "user_id": application.user.id})
 
-        except Exception as e:
-            print(f"Error in check_rejected_users: {e}")
+async def expire_inactive(channel_id):
+    application = await inactive_application(channel_id)
+    if application is None:
+        return
+    close_jobs.submit(channel_id, CloseJob(application.channel, "Автоматически (нет ответа)", None, release_whitelist=True))
+    log.info("Closing inactive application", extra={"channel_id": channel_id, "user_id": application.user.id})
 
-active_applications = []
+expiry = ExpiryScheduler(INACTIVITY_REMINDER_TIMEOUT, INACTIVITY_CLOSE_TIMEOUT, remind_inactive, expire_inactive)
+admin_roles = AdminRoleCache(ADMIN_ROLES)
 
 @bot.tree.command(name='setupticketbot', description='Настраивает систему заявок (только для администраторов)')
 @app_commands.guild_only()
 @app_commands.default_permissions(administrator=True)
 async def setupticketbot(interaction: discord.Interaction):
-    print("Setting up application system via slash command...")
+    log.info("Setting up application system via slash command", extra={"channel_id": interaction.channel.id, "user_id": interaction.user.id})
     await interaction.response.defer(ephemeral=True) 
 
     current_channel = interaction.channel
@@ -871,4 +1226,277 @@ async def setupticketbot(interaction: discord.Interaction):
 
     await interaction.followup.send("Система заявок настроена в текущем канале!", ephemeral=True)
 
-bot.run(TOKEN)
+@bot.tree.command(name='syncfailed', description='Заявки, которые не удалось синхронизировать с LuckPerms')
+@app_commands.guild_only()
+async def syncfailed(interaction: discord.Interaction):
+    if not await admin_roles.check(interaction):
+        return
+    await interaction.response.defer(ephemeral=True)
+    rows = await sync_queue.engine.fetch_dead_letters()
+    if not rows:
+        await interaction.followup.send("Нет заявок с ошибкой синхронизации.", ephemeral=True)
+        return
+    lines = [
+        f"#{number} {username} — ник: {nickname or '—'}, {action}, попыток: {attempts} ({error})"
+        for number, username, nickname, action, attempts, error in rows
+    ]
+    embed = discord.Embed(
+        title="Ошибки синхронизации с LuckPerms",
+        description="\n".join(lines)[:4096],
+        color=discord.Color.red()
+    )
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@bot.tree.command(name='syncretry', description='Повторить синхронизацию с LuckPerms для заявок с ошибкой')
+@app_commands.guild_only()
+@app_commands.describe(number='Номер заявки (по умолчанию — все)')
+async def syncretry(interaction: discord.Interaction, number: int = None):
+    if not await admin_roles.check(interaction):
+        return
+    await interaction.response.defer(ephemeral=True)
+    count = await sync_queue.retry_dead_letters(number)
+    await interaction.followup.send(f"Повторная синхронизация запущена для {count} заявок.", ephemeral=True)
+
+BULK_STATES = [
+    app_commands.Choice(name="Без решения", value="none"),
+    app_commands.Choice(name="Принята", value="accept"),
+    app_commands.Choice(name="Отклонена", value="rejected"),
+    app_commands.Choice(name="Временный отказ", value="temporary_failure"),
+]
+
+def answer_nickname(application):
+    if application is None or len(application.responses) < 2:
+        return None
+    lines = application.responses[1].text.strip().replace('`', '').splitlines()
+    nickname = lines[0].strip() if lines else ""
+    return nickname if nickname and len(nickname) <= 100 else None
+
+def questionnaire_complete(application):
+    return (
+        application is not None
+        and not application.closed
+        and not application.collecting_response
+        and application.current_question >= len(QUESTIONS)
+    )
+
+def format_numbers(tickets):
+    return ", ".join(f"#{ticket.number}" for ticket in tickets)[:1000]
+
+async def bulk_tickets(interaction, numbers, older_than_days, action, require_selection=False):
+    # Проверяет фильтр и отвечает на взаимодействие; None — ответ уже отправлен.
+    # require_selection: статус задан командой, поэтому нужны номера или возраст.
+    if not await admin_roles.check(interaction):
+        return None
+    if require_selection and not numbers and older_than_days is None:
+        await interaction.response.send_message("Укажите номера заявок или возраст.", ephemeral=True)
+        return None
+    if not numbers and older_than_days is None and not action:
+        await interaction.response.send_message("Укажите номера заявок, возраст или статус.", ephemeral=True)
+        return None
+    try:
+        number_set = parse_numbers(numbers) if numbers else None
+    except ValueError:
+        await interaction.response.send_message("Номера заявок указываются через запятую, например: 12, 15-20.", ephemeral=True)
+        return None
+    await interaction.response.defer(ephemeral=True)
+    return await select_tickets(mysql_pool, active_applications.channel_ids(), number_set, older_than_days, action)
+
+async def send_bulk_summary(interaction, title, lines):
+    embed = discord.Embed(title=title, description="\n".join(lines)[:4096], color=discord.Color.blue())
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+async def bulk_decide(interaction, tickets, action, make_embed, require_nickname, direct_message=None):
+    async def load(ticket):
+        channel = bot.get_channel(ticket.channel_id)
+        return await get_application(channel) if channel else None
+
+    applications = await asyncio.gather(*(load(ticket) for ticket in tickets))
+    async with contextlib.AsyncExitStack() as locks:
+        # Как и record_decision, решение записывается под блокировкой заявки:
+        # одновременное решение из модального окна не перезапишется, а
+        # повторное нажатие увидит уже принятое решение.
+        for application in {id(application): application for application in applications if application}.values():
+            await locks.enter_async_context(application.lock)
+        nicknames = {}
+        decided = []
+        skipped = []
+        incomplete = []
+        for ticket, application in zip(tickets, applications):
+            # Решение принимается только по заполненной анкете без решения
+            if not questionnaire_complete(application) or application.decision is not None:
+                incomplete.append(ticket)
+                continue
+            nickname = ticket.nickname or answer_nickname(application)
+            if require_nickname and not nickname:
+                skipped.append(ticket)
+                continue
+            nicknames[ticket.id] = nickname
+            decided.append((ticket, application, nickname))
+        if nicknames:
+            await update_decisions(mysql_pool, action, nicknames, datetime.now())
+        for ticket, application, nickname in decided:
+            application.decision = (action, nickname)
+            sync_queue.push(action, ticket.channel_id)
+
+        async def notify(application, nickname):
+            await rest_scheduler.submit(BACKGROUND, application.channel.send, embed=make_embed(nickname))
+            if direct_message:
+                run_in_background(send_direct_message(application.user, embed=direct_message(nickname)))
+
+        results = await asyncio.gather(*(notify(application, nickname) for _, application, nickname in decided), return_exceptions=True)
+    failed = [ticket for (ticket, _, _), result in zip(decided, results) if isinstance(result, Exception)]
+    log.info("Bulk decision applied", extra={"action": action, "user_id": interaction.user.id})
+    return [(ticket, nickname) for ticket, _, nickname in decided], skipped, incomplete, failed
+
+@bot.tree.command(name='bulkclose', description='Закрыть несколько заявок сразу')
+@app_commands.guild_only()
+@app_commands.describe(
+    numbers='Номера заявок, например: 12, 15-20',
+    older_than_days='Созданы не меньше N дней назад',
+    state='Статус заявки'
+)
+@app_commands.choices(state=BULK_STATES)
+async def bulkclose(interaction: discord.Interaction, numbers: str = None, older_than_days: int = None, state: str = None):
+    tickets = await bulk_tickets(interaction, numbers, older_than_days, state)
+    if tickets is None:
+        return
+    jobs = []
+    for ticket in tickets:
+        channel = bot.get_channel(ticket.channel_id)
+        if channel is None:
+            continue
+        # Без решения строка 'none' удаляется, чтобы пользователь мог подать заявку снова
+        job = CloseJob(channel, interaction.user, None, release_whitelist=ticket.action == 'none')
+        if close_jobs.submit(channel.id, job) is not None:
+            jobs.append((ticket, job))
+    results = await asyncio.gather(*(job.done for _, job in jobs))
+    closed = [ticket for (ticket, _), ok in zip(jobs, results) if ok]
+    failed = [ticket for (ticket, _), ok in zip(jobs, results) if not ok]
+    lines = [f"Найдено заявок: {len(tickets)}", f"Закрыто: {len(closed)}"]
+    if len(jobs) < len(tickets):
+        lines.append(f"Уже закрывались или канал не найден: {len(tickets) - len(jobs)}")
+    if failed:
+        lines.append(f"Ошибки: {format_numbers(failed)}")
+    await send_bulk_summary(interaction, "Массовое закрытие заявок", lines)
+
+@bot.tree.command(name='bulkaccept', description='Принять несколько заявок сразу')
+@app_commands.guild_only()
+@app_commands.describe(
+    numbers='Номера заявок, например: 12, 15-20',
+    older_than_days='Созданы не меньше N дней назад'
+)
+async def bulkaccept(interaction: discord.Interaction, numbers: str = None, older_than_days: int = None):
+    tickets = await bulk_tickets(interaction, numbers, older_than_days, "none", require_selection=True)
+    if tickets is None:
+        return
+    decided, skipped, incomplete, failed = await bulk_decide(
+        interaction,
+        tickets,
+        "accept",
+        lambda nickname: discord.Embed(title="Заявка принята", description=f"Ник: {nickname}", color=discord.Color.green()),
+        require_nickname=True,
+        direct_message=lambda nickname: discord.Embed(
+            title="Ваша заявка принята!",
+            description=f"Поздравляем! Ваш ник: {nickname}",
+            color=discord.Color.green()
+        )
+    )
+    lines = [f"Найдено заявок без решения: {len(tickets)}", f"Принято: {len(decided)}"]
+    if incomplete:
+        lines.append(f"Пропущено, анкета не заполнена или решение уже принято: {format_numbers(incomplete)}")
+    if skipped:
+        lines.append(f"Пропущено, ник не найден: {format_numbers(skipped)}")
+    if failed:
+        lines.append(f"Не удалось отправить сообщение: {format_numbers(failed)}")
+    await send_bulk_summary(interaction, "Массовое принятие заявок", lines)
+
+@bot.tree.command(name='bulkreject', description='Отклонить несколько заявок сразу')
+@app_commands.guild_only()
+@app_commands.describe(
+    reason='Причина отказа',
+    set_role='Ставить роль отклонённого игрока',
+    numbers='Номера заявок, например: 12, 15-20',
+    older_than_days='Созданы не меньше N дней назад'
+)
+async def bulkreject(interaction: discord.Interaction, reason: str, set_role: bool = True, numbers: str = None, older_than_days: int = None):
+    tickets = await bulk_tickets(interaction, numbers, older_than_days, "none", require_selection=True)
+    if tickets is None:
+        return
+    action = "rejected" if set_role else "temporary_failure"
+    decided, skipped, incomplete, failed = await bulk_decide(
+        interaction,
+        tickets,
+        action,
+        lambda nickname: discord.Embed(
+            title="Ваша заявка отклонена",
+            description=f"Причина: {reason}\nНик: {nickname or 'не указан'}",
+            color=discord.Color.red()
+        ),
+        require_nickname=False
+    )
+    lines = [f"Найдено заявок без решения: {len(tickets)}", f"Отклонено: {len(decided)}"]
+    if incomplete:
+        lines.append(f"Пропущено, анкета не заполнена или решение уже принято: {format_numbers(incomplete)}")
+    if failed:
+        lines.append(f"Не удалось отправить сообщение: {format_numbers(failed)}")
+    await send_bulk_summary(interaction, "Массовое отклонение заявок", lines)
+
+@bot.tree.command(name='archivesearch', description='Поиск по архиву закрытых заявок')
+@app_commands.guild_only()
+@app_commands.describe(
+    nickname='Ник игрока (или его начало)',
+    user='Пользователь дискорда',
+    date_from='Закрыта не раньше (ГГГГ-ММ-ДД)',
+    date_to='Закрыта не позже (ГГГГ-ММ-ДД)',
+    text='Слова из ответов анкеты'
+)
+async def archivesearch(interaction: discord.Interaction, nickname: str = None, user: discord.User = None, date_from: str = None, date_to: str = None, text: str = None):
+    if not await admin_roles.check(interaction):
+        return
+    try:
+        date_from = parse_date(date_from) if date_from else None
+        date_to = parse_date(date_to) if date_to else None
+    except ValueError:
+        await interaction.response.send_message("Дата должна быть в формате ГГГГ-ММ-ДД.", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True)
+    rows = await application_archive.search(nickname=nickname, user_id=user.id if user else None, date_from=date_from, date_to=date_to, text=text)
+    if not rows:
+        await interaction.followup.send("В архиве ничего не найдено.", ephemeral=True)
+        return
+    lines = []
+    for number, channel_name, user_id, username, nickname, closed_by, closed_at, archive_url in rows:
+        line = f"**#{number or '—'}** {channel_name} — ник: {nickname}, {f'<@{user_id}>' if user_id else username}, закрыл {closed_by}, {closed_at:%d.%m.%Y}"
+        if archive_url:
+            line += f" — [транскрипт]({archive_url})"
+        lines.append(line)
+    embed = discord.Embed(
+        title="Архив заявок",
+        description="\n".join(lines)[:4096],
+        color=discord.Color.blue()
+    )
+    embed.set_footer(text="Транскрипт по номеру заявки: /archivetranscript")
+    await interaction.followup.send(embed=embed, ephemeral=True)
+
+@bot.tree.command(name='archivetranscript', description='Транскрипт закрытой заявки из архива')
+@app_commands.guild_only()
+@app_commands.describe(number='Номер заявки')
+async def archivetranscript(interaction: discord.Interaction, number: int):
+    if not await admin_roles.check(interaction):
+        return
+    await interaction.response.defer(ephemeral=True)
+    result = await application_archive.transcript(number)
+    if not result:
+        await interaction.followup.send("Заявка с таким номером не найдена в архиве.", ephemeral=True)
+        return
+    channel_name, transcript = result
+    await interaction.followup.send(file=discord.File(io.BytesIO(transcript), filename=f"{channel_name}.html"), ephemeral=True)
+
+if __name__ == '__main__':
+    log_listener = setup_logging(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
+    logging.getLogger('ticketbot.sync').addFilter(RateLimitFilter(burst=LOG_RATE_LIMIT_BURST, interval=LOG_RATE_LIMIT_INTERVAL))
+    try:
+        bot.run(TOKEN, log_handler=None)
+    finally:
+        # Дописываем записи, оставшиеся в очереди
+        log_listener.stop()
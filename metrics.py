@@ -0,0 +1,242 @@
+import bisect
+import re
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        for key, value in self._values.items():
+            yield f"{self.name}{format_labels(self.labelnames, key)} {value}"
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_function(self, func, **labels):
+        self._functions[self._key(labels)] = func
+
+    def _samples(self):
+        yield from super()._samples()
+        for key, func in self._functions.items():
+            yield f"{self.name}{format_labels(self.labelnames, key)} {func()}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    @asynccontextmanager
+    async def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        bucket_names = self.labelnames + ("le",)
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{format_labels(bucket_names, key + (le,))} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{format_labels(self.labelnames, key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+INTERACTION_LATENCY = REGISTRY.register(Histogram(
+    "ticketbot_interaction_seconds", "Time spent handling component interactions", ("custom_id",)))
+DB_QUERY_LATENCY = REGISTRY.register(Histogram(
+    "ticketbot_db_query_seconds", "MySQL query execution time", ("pool", "query")))
+DB_POOL_WAIT = REGISTRY.register(Histogram(
+    "ticketbot_db_pool_wait_seconds", "Time spent waiting for a MySQL connection", ("pool",)))
+DISCORD_REQUESTS = REGISTRY.register(Counter(
+    "ticketbot_discord_requests_total", "Discord REST requests", ("method", "route")))
+DISCORD_RATE_LIMITS = REGISTRY.register(Counter(
+    "ticketbot_discord_rate_limited_total", "Discord REST responses with status 429"))
+DUPLICATE_INTERACTIONS = REGISTRY.register(Counter(
+    "ticketbot_duplicate_interactions_total", "Repeated button clicks dropped while the first one was processed", ("custom_id",)))
+ATTACHMENT_BYTES = REGISTRY.register(Counter(
+    "ticketbot_attachment_bytes_total", "Attachment bytes downloaded"))
+TRANSCRIPT_RENDER = REGISTRY.register(Histogram(
+    "ticketbot_transcript_render_seconds", "Time spent rendering ticket transcripts"))
+SYNC_SWEEP_DURATION = REGISTRY.register(Histogram(
+    "ticketbot_sync_sweep_seconds", "Duration of LuckPerms sync sweeps", ("action",)))
+SYNC_BACKLOG = REGISTRY.register(Gauge(
+    "ticketbot_sync_backlog", "Pending whitelist rows seen by the last LuckPerms sync sweep", ("action",)))
+REST_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "ticketbot_rest_queue_depth", "Queued background Discord REST calls", ("priority",)))
+REST_IN_FLIGHT = REGISTRY.register(Gauge(
+    "ticketbot_rest_in_flight", "Scheduled Discord REST calls currently running", ("priority",)))
+JOB_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "ticketbot_job_queue_depth", "Queued background jobs such as ticket closing", ("queue",)))
+OPEN_APPLICATIONS = REGISTRY.register(Gauge(
+    "ticketbot_open_applications", "Applications loaded in memory"))
+
+
+QUERY_RE = re.compile(r"^\s*(\w+)\b.*?\b(?:FROM|INTO|UPDATE|TABLE)\s+`?(\w+)", re.IGNORECASE | re.DOTALL)
+
+
+def query_label(query):
+    match = QUERY_RE.match(query)
+    if not match:
+        return query.split(None, 1)[0].upper() if query.strip() else "unknown"
+    return f"{match.group(1).upper()} {match.group(2)}"
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor, pool_name):
+        self._cursor = cursor
+        self._pool_name = pool_name
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    async def execute(self, query, args=None):
+        async with DB_QUERY_LATENCY.time(pool=self._pool_name, query=query_label(query)):
+            return await self._cursor.execute(query, args)
+
+    async def executemany(self, query, args):
+        async with DB_QUERY_LATENCY.time(pool=self._pool_name, query=query_label(query)):
+            return await self._cursor.executemany(query, args)
+
+
+class InstrumentedConnection:
+    def __init__(self, conn, pool_name):
+        self._conn = conn
+        self._pool_name = pool_name
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    @asynccontextmanager
+    async def cursor(self, *args):
+        async with self._conn.cursor(*args) as cur:
+            yield InstrumentedCursor(cur, self._pool_name)
+
+
+class InstrumentedPool:
+    def __init__(self, pool, name):
+        self._pool = pool
+        self.name = name
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    @asynccontextmanager
+    async def acquire(self):
+        start = time.perf_counter()
+        async with self._pool.acquire() as conn:
+            DB_POOL_WAIT.observe(time.perf_counter() - start, pool=self.name)
+            yield InstrumentedConnection(conn, self.name)
+
+
+def http_trace():
+    # discord.py сам повторяет запросы после 429, поэтому статус берётся из
+    # ответа aiohttp, а не из исключения или лога
+    async def on_request_end(session, context, params):
+        if params.response.status == 429:
+            DISCORD_RATE_LIMITS.inc()
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_end.append(on_request_end)
+    return trace
+
+
+def instrument_http(http):
+    request = http.request
+
+    async def instrumented_request(route, **kwargs):
+        DISCORD_REQUESTS.inc(method=route.method, route=route.path)
+        return await request(route, **kwargs)
+
+    http.request = instrumented_request
+
+
+async def start_server(host, port):
+    async def handle(request):
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return runner
@@ -0,0 +1,149 @@
+import logging
+
+import aiomysql
+
+log = logging.getLogger('ticketbot.migrations')
+
+# MySQL фиксирует DDL сразу, поэтому шаг, прерванный посередине, при
+# следующем запуске выполняется заново. Каждая инструкция должна быть
+# повторяемой: CREATE TABLE IF NOT EXISTS или проверка через
+# information_schema.
+
+
+def create_index(table, name, columns):
+    async def step(cur):
+        await cur.execute(
+            "SELECT 1 FROM information_schema.statistics WHERE table_schema=DATABASE() AND table_name=%s AND index_name=%s LIMIT 1",
+            (table, name)
+        )
+        if not await cur.fetchone():
+            await cur.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+    return step
+
+
+def add_column(table, name, definition):
+    async def step(cur):
+        await cur.execute(
+            "SELECT 1 FROM information_schema.columns WHERE table_schema=DATABASE() AND table_name=%s AND column_name=%s LIMIT 1",
+            (table, name)
+        )
+        if not await cur.fetchone():
+            await cur.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+    return step
+
+
+MIGRATIONS = [
+    (1, [
+        """CREATE TABLE IF NOT EXISTS whitelist (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(100) UNIQUE,
+            action VARCHAR(32) DEFAULT 'none',
+            create_datetime DATETIME,
+            role_datetime DATETIME,
+            nickname VARCHAR(100),
+            channel_id BIGINT,
+            `join` INT DEFAULT 0,
+            application_number INT DEFAULT 0
+        )""",
+        """CREATE TABLE IF NOT EXISTS application_counter (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            last_number INT DEFAULT 0
+        )""",
+        "INSERT IGNORE INTO application_counter (id, last_number) VALUES (1, 0)",
+        """CREATE TABLE IF NOT EXISTS whitelist_sync_retry (
+            whitelist_id INT PRIMARY KEY,
+            attempts INT DEFAULT 0,
+            next_attempt_at DATETIME,
+            dead TINYINT DEFAULT 0,
+            last_error VARCHAR(255)
+        )""",
+    ]),
+    (2, [
+        create_index("whitelist", "idx_whitelist_channel_id", "channel_id"),
+        create_index("whitelist", "idx_whitelist_action_join", "action, `join`"),
+        add_column("whitelist", "user_id", "BIGINT NULL"),
+        create_index("whitelist", "idx_whitelist_user_id", "user_id"),
+    ]),
+    (3, [
+        """CREATE TABLE IF NOT EXISTS application_state (
+            channel_id BIGINT PRIMARY KEY,
+            user_id BIGINT,
+            state MEDIUMTEXT,
+            updated_at DATETIME
+        )""",
+    ]),
+    (4, [
+        """CREATE TABLE IF NOT EXISTS bot_state (
+            name VARCHAR(64) PRIMARY KEY,
+            value VARCHAR(255)
+        )""",
+    ]),
+    (5, [
+        """CREATE TABLE IF NOT EXISTS application_archive (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            application_number INT,
+            channel_id BIGINT,
+            channel_name VARCHAR(100),
+            user_id BIGINT NULL,
+            username VARCHAR(100),
+            nickname VARCHAR(100),
+            closed_by VARCHAR(100),
+            closed_at DATETIME,
+            archive_url VARCHAR(255),
+            answers MEDIUMTEXT,
+            transcript MEDIUMBLOB,
+            INDEX idx_archive_application_number (application_number),
+            INDEX idx_archive_user_id (user_id, closed_at),
+            INDEX idx_archive_nickname (nickname),
+            INDEX idx_archive_closed_at (closed_at),
+            FULLTEXT INDEX ft_archive_answers (answers)
+        ) DEFAULT CHARSET=utf8mb4""",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def current_version(cur):
+    try:
+        await cur.execute("SELECT MAX(version) FROM schema_version")
+    except aiomysql.ProgrammingError:
+        return None
+    result = await cur.fetchone()
+    return result[0] or 0
+
+
+async def migrate(pool):
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            version = await current_version(cur)
+            if version == LATEST_VERSION:
+                return version
+
+            # Блокировка на случай одновременного запуска нескольких копий бота
+            await cur.execute("SELECT GET_LOCK('ticketbot_migrations', 60)")
+            locked = await cur.fetchone()
+            if not locked or locked[0] != 1:
+                raise RuntimeError("timed out waiting for the schema migration lock")
+            try:
+                await cur.execute(
+                    """CREATE TABLE IF NOT EXISTS schema_version (
+                        version INT PRIMARY KEY,
+                        applied_at DATETIME
+                    )"""
+                )
+                version = await current_version(cur)
+                for migration_version, statements in MIGRATIONS:
+                    if migration_version <= version:
+                        continue
+                    for statement in statements:
+                        if callable(statement):
+                            await statement(cur)
+                        else:
+                            await cur.execute(statement)
+                    await cur.execute("INSERT INTO schema_version (version, applied_at) VALUES (%s, NOW())", (migration_version,))
+                    log.info("Applied schema migration %d", migration_version)
+                    version = migration_version
+            finally:
+                await cur.execute("SELECT RELEASE_LOCK('ticketbot_migrations')")
+    return version
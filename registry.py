@@ -0,0 +1,42 @@
+class ApplicationRegistry:
+    def __init__(self):
+        self._by_channel = {}
+        self._by_user = {}
+        self._dormant = set()
+
+    def add(self, application):
+        self._by_channel[application.channel.id] = application
+        self._by_user[application.user.id] = application
+        self._dormant.discard(application.channel.id)
+
+    def add_dormant(self, channel_id):
+        if channel_id not in self._by_channel:
+            self._dormant.add(channel_id)
+
+    def is_dormant(self, channel_id):
+        return channel_id in self._dormant
+
+    def remove(self, channel_id):
+        self._dormant.discard(channel_id)
+        application = self._by_channel.pop(channel_id, None)
+        if application is not None and self._by_user.get(application.user.id) is application:
+            del self._by_user[application.user.id]
+        return application
+
+    def get(self, channel_id):
+        return self._by_channel.get(channel_id)
+
+    def get_by_user(self, user_id):
+        return self._by_user.get(user_id)
+
+    def channel_ids(self):
+        return list(self._by_channel) + list(self._dormant)
+
+    def __contains__(self, channel_id):
+        return channel_id in self._by_channel or channel_id in self._dormant
+
+    def __len__(self):
+        return len(self._by_channel)
+
+    def __iter__(self):
+        return iter(list(self._by_channel.values()))
@@ -0,0 +1,66 @@
+import asyncio
+from collections import deque
+
+NORMAL = 1
+BACKGROUND = 2
+
+
+class RestScheduler:
+    # Вызовы, без которых не ответить на взаимодействие (ответ на кнопку,
+    # следующий вопрос), идут к Discord напрямую, а остальная работа — через
+    # этот планировщик. Очереди разбираются по приоритету: сводки (NORMAL)
+    # запускаются первыми в пределах своего лимита, а удаления, архив и ЛС
+    # (BACKGROUND) не стартуют, пока есть ожидающие или выполняющиеся
+    # NORMAL-вызовы, чтобы не занимать те же rate limit бакеты.
+    def __init__(self, concurrency=2, normal_concurrency=2):
+        self.limits = {NORMAL: normal_concurrency, BACKGROUND: concurrency}
+        self._queues = {NORMAL: deque(), BACKGROUND: deque()}
+        self.in_flight = {NORMAL: 0, BACKGROUND: 0}
+        self._tasks = set()
+
+    def depth(self):
+        return {priority: len(queue) for priority, queue in self._queues.items()}
+
+    async def submit(self, priority, func, *args, **kwargs):
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].append((func, args, kwargs, future))
+        self._dispatch()
+        return await future
+
+    def _can_start(self, priority):
+        if self.in_flight[priority] >= self.limits[priority]:
+            return False
+        return priority == NORMAL or not (self._queues[NORMAL] or self.in_flight[NORMAL])
+
+    def _dispatch(self):
+        for priority in (NORMAL, BACKGROUND):
+            queue = self._queues[priority]
+            while queue and self._can_start(priority):
+                func, args, kwargs, future = queue.popleft()
+                if future.cancelled():
+                    continue
+                self.in_flight[priority] += 1
+                task = asyncio.ensure_future(self._run(priority, func, args, kwargs, future))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, priority, func, args, kwargs, future):
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            if not future.cancelled():
+                future.set_exception(e)
+        else:
+            if not future.cancelled():
+                future.set_result(result)
+        finally:
+            self.in_flight[priority] -= 1
+            self._dispatch()
+
+    async def close(self):
+        for queue in self._queues.values():
+            for _, _, _, future in queue:
+                future.cancel()
+            queue.clear()
+        for task in list(self._tasks):
+            task.cancel()
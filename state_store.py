@@ -0,0 +1,80 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+
+from lp_sync import placeholders
+
+log = logging.getLogger('ticketbot.state')
+
+
+class ApplicationStateStore:
+    def __init__(self, pool, flush_interval=5):
+        self.pool = pool
+        self.flush_interval = flush_interval
+        self._dirty = {}
+        self._deleted = set()
+
+    def mark_dirty(self, application):
+        self._dirty[application.channel.id] = application
+        self._deleted.discard(application.channel.id)
+
+    def delete(self, channel_id):
+        self._dirty.pop(channel_id, None)
+        self._deleted.add(channel_id)
+
+    async def load(self, channel_id):
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT user_id, state FROM application_state WHERE channel_id=%s", (channel_id,))
+                result = await cur.fetchone()
+        if not result:
+            return None
+        return result[0], json.loads(result[1])
+
+    async def load_all(self):
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT state FROM application_state")
+                rows = await cur.fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    async def flush(self):
+        if not self._dirty and not self._deleted:
+            return
+        dirty, self._dirty = self._dirty, {}
+        deleted, self._deleted = self._deleted, set()
+        now = datetime.now()
+        rows = [
+            (channel_id, application.user.id, json.dumps(application.to_state(), ensure_ascii=False), now)
+            for channel_id, application in dirty.items()
+        ]
+        try:
+            async with self.pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    if rows:
+                        await cur.executemany(
+                            "INSERT INTO application_state (channel_id, user_id, state, updated_at) VALUES (%s, %s, %s, %s) "
+                            "ON DUPLICATE KEY UPDATE user_id=VALUES(user_id), state=VALUES(state), updated_at=VALUES(updated_at)",
+                            rows
+                        )
+                    if deleted:
+                        await cur.execute(
+                            f"DELETE FROM application_state WHERE channel_id IN ({placeholders(len(deleted))})",
+                            list(deleted)
+                        )
+        except Exception:
+            # Возвращаем несохранённое, не затирая более свежие изменения
+            for channel_id, application in dirty.items():
+                if channel_id not in self._deleted:
+                    self._dirty.setdefault(channel_id, application)
+            self._deleted |= {channel_id for channel_id in deleted if channel_id not in self._dirty}
+            raise
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("Error flushing application state")
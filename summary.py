@@ -0,0 +1,61 @@
+MAX_FIELDS = 25
+MAX_EMBED_CHARS = 6000
+MAX_FIELD_VALUE = 1024
+MAX_FILES_PER_MESSAGE = 10
+MAX_MESSAGE_CHARS = 2000
+
+
+def answer_fields(questions, responses):
+    for i, (question, response) in enumerate(zip(questions, responses), 1):
+        text = response.text
+        if not text:
+            yield f"{i}. {question}", "[нет ответа]"
+            continue
+        for j in range(0, len(text), MAX_FIELD_VALUE):
+            yield f"{i}. {question}" if j == 0 else f"Продолжение ответа {i}", text[j:j + MAX_FIELD_VALUE]
+
+
+def paginate_fields(fields, make_embed):
+    # Одно сообщение вмещает не больше 6000 символов во всех embed'ах,
+    # поэтому каждая страница отправляется отдельным сообщением.
+    embeds = [make_embed(0)]
+    for name, value in fields:
+        embed = embeds[-1]
+        if len(embed.fields) >= MAX_FIELDS or len(embed) + len(name) + len(value) > MAX_EMBED_CHARS:
+            embed = make_embed(len(embeds))
+            embeds.append(embed)
+        embed.add_field(name=name, value=value, inline=False)
+    return embeds
+
+
+def batch_files(files, max_bytes):
+    batches = []
+    current = []
+    current_size = 0
+    for file in files:
+        size = file.size
+        if current and (len(current) >= MAX_FILES_PER_MESSAGE or current_size + size > max_bytes):
+            batches.append(current)
+            current = []
+            current_size = 0
+        current.append(file)
+        current_size += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def reference_messages(files, header="Ранее приложенные файлы:"):
+    lines = [f"{file.filename}: {file.message_url or file.url}" for file in files if file.message_url or file.url]
+    if not lines:
+        return []
+    messages = []
+    current = header
+    for line in lines:
+        if len(current) + 1 + len(line) > MAX_MESSAGE_CHARS:
+            messages.append(current)
+            current = line[:MAX_MESSAGE_CHARS]
+        else:
+            current += "\n" + line
+    messages.append(current)
+    return messages
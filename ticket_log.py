@@ -0,0 +1,96 @@
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger('ticketbot.transcript')
+
+# Первая строка журнала: по ней отличается полный журнал от дописанного
+# к заявке, открытой до его появления.
+HEADER = {"ticket_log": 1}
+
+
+class TicketLog:
+    # Сообщения заявки дописываются в JSONL-файл по мере поступления, поэтому
+    # при закрытии транскрипт собирается без чтения истории канала и
+    # сохраняет ответы, удалённые по ходу анкеты. Запись идёт в одном
+    # отдельном потоке: порядок строк сохраняется, а event loop не ждёт диск.
+    def __init__(self, directory, flush_interval=2):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ticket-log")
+
+    def path(self, channel_id):
+        return os.path.join(self.directory, f"{channel_id}.jsonl")
+
+    def open(self, channel_id):
+        self._pending[channel_id] = [json.dumps(HEADER)]
+
+    def append(self, channel_id, record):
+        self._pending.setdefault(channel_id, []).append(json.dumps(record, ensure_ascii=False))
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _write(self, batches):
+        os.makedirs(self.directory, exist_ok=True)
+        for channel_id, lines in batches.items():
+            with open(self.path(channel_id), "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+
+    def _read(self, channel_id):
+        try:
+            with open(self.path(channel_id), encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return None
+        if not records or records[0] != HEADER:
+            return None
+        return records[1:]
+
+    def _remove(self, channel_id):
+        try:
+            os.remove(self.path(channel_id))
+        except FileNotFoundError:
+            pass
+
+    async def flush(self, channel_id=None):
+        if channel_id is None:
+            batches, self._pending = self._pending, {}
+        else:
+            lines = self._pending.pop(channel_id, None)
+            batches = {channel_id: lines} if lines else {}
+        if not batches:
+            return
+        try:
+            await self._run(self._write, batches)
+        except Exception:
+            # Возвращаем строки перед новыми, чтобы не нарушить порядок
+            for batch_channel_id, lines in batches.items():
+                self._pending[batch_channel_id] = lines + self._pending.get(batch_channel_id, [])
+            raise
+
+    async def read(self, channel_id):
+        # None — полного журнала нет (заявка открыта до его появления)
+        await self.flush(channel_id)
+        return await self._run(self._read, channel_id)
+
+    async def delete(self, channel_id):
+        self._pending.pop(channel_id, None)
+        await self._run(self._remove, channel_id)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("Error writing ticket logs")
+
+    async def close(self):
+        try:
+            await self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
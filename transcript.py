@@ -0,0 +1,117 @@
+import html
+import io
+import re
+
+EMOJI_RE = re.compile(r"&lt;(a?):(\w+):(\d+)&gt;")
+
+STYLE = """body { font-family: sans-serif; background-color: #36393f; color: #dcddde; }
+.message { display: flex; margin-bottom: 10px; padding: 5px; background-color: #303338; border-radius: 5px; }
+.avatar { width: 40px; height: 40px; border-radius: 50%; margin-right: 10px; }
+.message-content { flex-grow: 1; }
+.author { font-weight: bold; color: #ffffff; }
+.timestamp { font-size: 0.8em; color: #72767d; margin-left: 10px; }
+.content { margin-top: 5px; white-space: pre-wrap; }
+.embed { border-left: 4px solid #7289da; padding: 10px; margin-top: 10px; background-color: #2c2f33; }
+.embed-title { font-weight: bold; color: #ffffff; margin-bottom: 5px; }
+.embed-description { font-size: 0.9em; color: #dcddde; margin-bottom: 5px; }
+.embed-field { margin-bottom: 5px; }
+.embed-field-name { font-weight: bold; color: #ffffff; }
+.embed-field-value { font-size: 0.9em; color: #dcddde; }
+.attachment { display: block; margin-top: 5px; color: #00b0f4; text-decoration: none; }
+"""
+
+
+def replace_emoji(match):
+    is_animated = match.group(1)
+    emoji_name = match.group(2)
+    emoji_id = match.group(3)
+    extension = 'gif' if is_animated else 'png'
+    emoji_url = f'https://cdn.discordapp.com/emojis/{emoji_id}.{extension}'
+    return f"<img src='{emoji_url}' alt=':{emoji_name}:' style='vertical-align: middle; height: 1em;'>"
+
+
+def render_text(text):
+    return EMOJI_RE.sub(replace_emoji, html.escape(text))
+
+
+def message_record(message):
+    # Компактное представление сообщения: только то, что попадает в
+    # транскрипт, пустые поля опускаются.
+    record = {"created_at": message.created_at.strftime('%Y-%m-%d %H:%M:%S')}
+    if message.author:
+        avatar = message.author.avatar or message.author.default_avatar
+        record["author"] = message.author.display_name
+        record["avatar"] = str(avatar.url)
+    if message.content:
+        record["content"] = message.content
+    if message.embeds:
+        record["embeds"] = [
+            [embed.title, embed.description, [[field.name, field.value] for field in embed.fields]]
+            for embed in message.embeds
+        ]
+    if message.attachments:
+        record["attachments"] = [[attachment.filename, attachment.url] for attachment in message.attachments]
+    return record
+
+
+def render_transcript(title, records):
+    transcript = TranscriptWriter(title)
+    for record in records:
+        transcript.add_record(record)
+    return transcript.finish()
+
+
+class TranscriptWriter:
+    def __init__(self, title):
+        self.buffer = io.BytesIO()
+        title = html.escape(title)
+        self._write(
+            "<!DOCTYPE html>\n<html>\n<head>\n<meta charset='utf-8'>\n"
+            f"<title>Чат заявки: {title}</title>\n<style>\n{STYLE}</style>\n</head>\n<body>\n"
+            f"<h1>Чат заявки: {title}</h1>\n"
+        )
+
+    def _write(self, chunk):
+        self.buffer.write(chunk.encode("utf-8"))
+
+    def add_message(self, message):
+        self.add_record(message_record(message))
+
+    def add_record(self, record):
+        author_display_name = record.get("author") or "Неизвестный пользователь"
+        parts = [
+            "<div class='message'>",
+            f"<img class='avatar' src='{html.escape(record.get('avatar', ''))}' alt='{html.escape(author_display_name)}'>",
+            "<div class='message-content'>",
+            f"<span class='author'>{html.escape(author_display_name)}</span>"
+            f"<span class='timestamp'>{record['created_at']}</span>",
+        ]
+
+        if record.get("content"):
+            parts.append(f"<p class='content'>{render_text(record['content'])}</p>")
+
+        for title, description, fields in record.get("embeds", ()):
+            parts.append("<div class='embed'>")
+            if title:
+                parts.append(f"<div class='embed-title'>{render_text(title)}</div>")
+            if description:
+                parts.append(f"<div class='embed-description'>{render_text(description)}</div>")
+            for name, value in fields:
+                parts.append(
+                    "<div class='embed-field'>"
+                    f"<div class='embed-field-name'>{render_text(name)}</div>"
+                    f"<div class='embed-field-value'>{render_text(value)}</div>"
+                    "</div>"
+                )
+            parts.append("</div>")
+
+        for filename, url in record.get("attachments", ()):
+            parts.append(f"<a href='{html.escape(url)}' class='attachment'>{html.escape(filename)}</a>")
+
+        parts.append("</div></div>\n")
+        self._write("".join(parts))
+
+    def finish(self):
+        self._write("</body>\n</html>\n")
+        self.buffer.seek(0)
+        return self.buffer